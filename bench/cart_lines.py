@@ -0,0 +1,84 @@
+"""Merging, changing and removing lines of a large cart.
+
+Compares Cart, whose lines are kept in a dict keyed by product, color and
+size, with the list it used to keep them in, which was scanned with an
+__eq__ that built a list for all() on every comparison.
+
+    python bench/cart_lines.py [lines] [operations]
+"""
+import sys
+import time
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+import database as db
+import model
+
+class ListCart():
+    """Cart lines as they used to be stored."""
+
+    def __init__(self) -> None:
+        self.cart_items = []
+
+    @staticmethod
+    def same_line(item, other) -> bool:
+        return all([item.product_id == other.product_id,
+                    item.color == other.color, item.size == other.size])
+
+    def change_quantity(self, item, amount: int) -> None:
+        for item_in_cart in self.cart_items:
+            if self.same_line(item_in_cart, item):
+                item_in_cart.change_quantity(amount)
+                return
+
+    def remove_item(self, item) -> None:
+        for index, item_in_cart in enumerate(self.cart_items):
+            if self.same_line(item_in_cart, item):
+                del self.cart_items[index]
+                return
+
+def run(cart, items, operations: int) -> float:
+    """Returns seconds taken to merge into, and then remove, the last
+    lines of a cart."""
+    last = items[-operations:]
+    start = time.perf_counter()
+    for item in last:
+        cart.change_quantity(item, 1)
+    for item in last:
+        cart.remove_item(item)
+    return time.perf_counter() - start
+
+def add_products(lines: int) -> None:
+    """Adds one product per line to the copy of the database, since
+    quantities are checked against stock."""
+    with db.session_scope() as session:
+        session.execute(model.Product.__table__.insert(), [
+            {'product_id': f'b{i:06d}', 'name': 'p', 'price': 1.0,
+             'category': model.Category.MAKEUP.value, 'description': '.',
+             'images': 'a.jpg', 'colors': 'Negro', 'sizes': 'M',
+             'available_units': 10**6}
+            for i in range(lines)
+        ])
+    model.catalogue.load()
+
+def make_items(lines: int) -> list[model.CartItem]:
+    return [model.CartItem(f'b{i:06d}', 1, 'Negro', 'M')
+            for i in range(lines)]
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    add_products(lines)
+    list_cart = ListCart()
+    list_cart.cart_items = make_items(lines)
+    before = run(list_cart, make_items(lines), operations)
+    cart = model.Cart()
+    for item in make_items(lines):
+        cart.cart_items[item.key] = item
+    after = run(cart, make_items(lines), operations)
+    print(f'{operations} merges and {operations} removes, '
+          f'{lines}-line cart')
+    print(f'  list: {before*1e3:10.2f} ms')
+    print(f'  dict: {after*1e3:10.2f} ms')
@@ -0,0 +1,55 @@
+"""Time and number of components to build the catalogue section with
+1,000 products.
+
+Only the selected tab is built when the section is rendered; the others are
+built when first selected. For comparison, the section is also built with
+every tab, as it used to be. SQL statements are counted too, since the
+catalogue is built from one read of the products.
+
+    python bench/catalogue_build.py [products] [builds]
+"""
+import sys
+import time
+
+from common import (add_products, count_components, find_component,
+                    load_webapp, use_copy_of_shop)
+
+use_copy_of_shop()
+
+import justpy as jp
+from sqlalchemy import event
+
+import database as db
+import model
+
+def build(webapp, all_tabs: bool) -> jp.Div:
+    """Builds the catalogue section as its first render does."""
+    section_div = jp.Div()
+    webapp.shop_section(section_div)
+    tabs = find_component(section_div, model.TabsPills)
+    for tab in tabs.tabs:
+        if all_tabs or tab['id'] == tabs.value:
+            tabs.set_content_div(tab)
+    return section_div
+
+if __name__ == '__main__':
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    builds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    webapp = load_webapp()
+    add_products(products)
+    statements = [0]
+    event.listen(db.get_engine(), 'before_cursor_execute',
+                 lambda *args: statements.__setitem__(0, statements[0]+1))
+    print(f'Catalogue section with {products} products, '
+          f'mean of {builds} builds')
+    for label, all_tabs in (('every tab', True), ('selected tab', False)):
+        statements[0] = 0
+        start = time.perf_counter()
+        for _ in range(builds):
+            section_div = build(webapp, all_tabs)
+            components = count_components(section_div)
+            section_div.delete()
+        elapsed = (time.perf_counter()-start) / builds
+        print(f'  {label:12s} {elapsed*1e3:7.1f} ms, '
+              f'{components:5d} components, '
+              f'{statements[0]/builds:.0f} SQL statements')
@@ -0,0 +1,62 @@
+"""Catalogue tabs rendered per second, with and without the read model.
+
+With the read model, each tab is built from the catalogue's snapshot. For
+comparison, Catalogue.page is replaced with the keyset query it stands in
+for, so every page is read from the database.
+
+    python bench/catalogue_snapshot.py [products] [renders]
+"""
+import sys
+import time
+
+from common import add_products, find_component, load_webapp, use_copy_of_shop
+
+use_copy_of_shop()
+
+import justpy as jp
+from sqlalchemy import select
+
+import database as db
+import migrations
+import model
+
+def page_from_db(category=None, after=None, limit=20):
+    """Same page as Catalogue.page, read from the database."""
+    query = select(model.Product).where(model.Product.available_units > 0)
+    if category is not None:
+        query = query.where(model.Product.category == category)
+    if after is not None:
+        query = query.where(model.Product.product_id > after)
+    query = query.order_by(model.Product.product_id).limit(limit+1)
+    with db.session_scope() as session:
+        products = list(session.execute(query).scalars())
+    if len(products) > limit:
+        return products[:limit], products[limit-1].product_id
+    return products, None
+
+def renders_per_second(webapp, renders: int) -> float:
+    """Builds the catalogue section and one of its tabs, cycling through the
+    categories, and returns renders per second."""
+    categories = [category.value for category in model.Category]
+    start = time.perf_counter()
+    for i in range(renders):
+        section_div = jp.Div()
+        webapp.shop_section(section_div)
+        tabs = find_component(section_div, model.TabsPills)
+        tabs.set_content_div(tabs.tabs[i % len(tabs.tabs)])
+        section_div.delete()
+    return renders / (time.perf_counter()-start)
+
+if __name__ == '__main__':
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    renders = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    # Indexes the query relies on
+    migrations.upgrade()
+    webapp = load_webapp()
+    add_products(products)
+    print(f'Catalogue tab renders with {products} extra products')
+    with_snapshot = renders_per_second(webapp, renders)
+    model.catalogue.page = page_from_db
+    without_snapshot = renders_per_second(webapp, renders)
+    print(f'  database query:   {without_snapshot:6.0f} renders/s')
+    print(f'  catalogue:        {with_snapshot:6.0f} renders/s')
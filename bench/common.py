@@ -0,0 +1,89 @@
+"""Helpers shared by the benchmarks in this folder.
+
+Benchmarks are run from the repository root, for example:
+    python bench/session_overhead.py
+They work on a temporary copy of the shop's database and text files, so
+the real ones are never modified.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+DATA_FILES = ('shop.db', 'admin.txt', 'ayuda.txt', 'costo_envios.txt',
+              'perfil.txt')
+
+def use_copy_of_shop(media: bool = False) -> str:
+    """Copies the shop's data files to a temporary folder, which becomes
+    the working directory, and points the database layer at its copy of
+    shop.db. The folder is removed when the benchmark exits.
+
+    Parameters:
+    media (bool): Whether the media folder is copied too; an empty one is
+    created otherwise.
+
+    Returns:
+    str: Path of the temporary folder.
+    """
+    directory = tempfile.mkdtemp(prefix='shop-bench-')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(ROOT, name), directory)
+    if media:
+        shutil.copytree(os.path.join(ROOT, 'media'),
+                        os.path.join(directory, 'media'))
+    else:
+        os.mkdir(os.path.join(directory, 'media'))
+    os.chdir(directory)
+    import database as db
+    db.configure_engine(f'sqlite:///{directory}/shop.db')
+    return directory
+
+def load_webapp() -> types.ModuleType:
+    """Runs src/webapp.py without starting the server and returns it as a
+    module, so that its pages and sections can be built directly."""
+    path = os.path.join(ROOT, 'src', 'webapp.py')
+    with open(path, encoding='utf-8') as f:
+        source = f.read().replace('jp.justpy(main_page)', '')
+    webapp = types.ModuleType('webapp')
+    webapp.__file__ = path
+    sys.modules['webapp'] = webapp
+    exec(compile(source, path, 'exec'), webapp.__dict__)
+    return webapp
+
+def add_products(count: int, first_id: int = 100000) -> None:
+    """Adds count synthetic products, spread over every category, to the
+    copy of the database and reloads the catalogue."""
+    import database as db
+    import model
+    categories = [category.value for category in model.Category]
+    with db.session_scope() as session:
+        session.execute(model.Product.__table__.insert(), [
+            {'product_id': str(first_id+i), 'name': f'Producto {i}',
+             'price': 10000.0, 'category': categories[i % len(categories)],
+             'description': 'Descripción', 'images': 'a.jpg-b.jpg',
+             'colors': 'Negro-Rosa', 'sizes': 'S-M-L', 'available_units': 5}
+            for i in range(count)
+        ])
+    model.catalogue.load()
+
+def count_components(component) -> int:
+    """Returns number of justpy components in a tree."""
+    return 1 + sum(count_components(child)
+                   for child in getattr(component, 'components', []))
+
+def find_component(component, kind: type):
+    """Returns first component of a kind in a tree, or None."""
+    if isinstance(component, kind):
+        return component
+    for child in getattr(component, 'components', []):
+        if (found:=find_component(child, kind)) is not None:
+            return found
+    return None
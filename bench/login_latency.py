@@ -0,0 +1,60 @@
+"""Event loop lag while several admin logins are verified at once.
+
+Compares verifying the password on the event loop, as the login used to,
+with verify_password_async, which runs Argon2 in its own executor. Lag is
+how late a task that sleeps 5 ms in a loop wakes up; it delays every other
+event of every session.
+
+    python bench/login_latency.py [logins]
+"""
+import asyncio
+import sys
+import time
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+import file_handling as file
+import hasher
+
+PASSWORD = 'clave123'
+TICK = 0.005
+
+async def measure_lag(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter()-start-TICK)
+
+async def run(logins: int, on_loop: bool) -> None:
+    async def login() -> bool:
+        if on_loop:
+            return hasher.verify_password(PASSWORD)
+        return await hasher.verify_password_async(PASSWORD)
+
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    assert all(results)
+    lags.sort()
+    label = 'on event loop' if on_loop else 'in executor'
+    print(f'  {label:14s} {elapsed*1e3:6.0f} ms total, loop lag '
+          f'max {lags[-1]*1e3:6.1f} ms, '
+          f'p99 {lags[int(len(lags)*0.99)]*1e3:6.1f} ms')
+
+if __name__ == '__main__':
+    # More would be rejected by the executor's queue limit
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 \
+             else hasher.MAX_PENDING_HASHES
+    # Password known to the benchmark, on the copy of admin.txt
+    file.write_over_file('admin.txt', 'Clave', hasher._hasher.hash(PASSWORD))
+    print(f'{logins} concurrent logins')
+    for on_loop in (True, False):
+        asyncio.run(run(logins, on_loop))
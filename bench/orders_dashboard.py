@@ -0,0 +1,83 @@
+"""Time, SQL statements and components to render the admin's orders tab
+with 10,000 orders.
+
+The tab lists a page of orders in single rows, loading their items and
+products with one query each. For comparison, every order is displayed
+with its details, loading items and products one order at a time, as the
+tab used to.
+
+    python bench/orders_dashboard.py [orders]
+"""
+import asyncio
+import sys
+import time
+
+from common import count_components, load_webapp, use_copy_of_shop
+
+use_copy_of_shop()
+
+import justpy as jp
+from sqlalchemy import event
+
+import database as db
+import migrations
+import model
+
+ITEMS_PER_ORDER = 3
+STATUSES = [status.value for status in model.OrderStatus]
+
+def add_orders(count: int) -> None:
+    """Adds count synthetic orders, each with a few items of the shop's
+    products, to the copy of the database."""
+    product_ids = [product.product_id
+                   for product in db.get_table_objects(model.Product)]
+    with db.get_engine().begin() as connection:
+        connection.execute(model.Order.__table__.insert(), [
+            {'order_id': f'b{i:06d}', 'total': 50000.0,
+             'buyer_name': 'Compradora', 'buyer_email': 'c@ejemplo.com',
+             'buyer_phone': '3000000000', 'ship_city': 'Barranquilla',
+             'ship_department': 'Atlántico', 'ship_address': 'Calle 1',
+             'ship_zipcode': '080001',
+             'date': f'2023-{i%12+1:02d}-{i%28+1:02d}',
+             'status': STATUSES[i % len(STATUSES)]}
+            for i in range(count)
+        ])
+        connection.execute(model.OrderItem.__table__.insert(), [
+            {'order_id': f'b{i:06d}',
+             'product_id': product_ids[(i+j) % len(product_ids)],
+             'quantity': 1, 'color': 'Negro', 'size': 'M'}
+            for i in range(count) for j in range(ITEMS_PER_ORDER)
+        ])
+
+def display_every_order(webapp, section_div: jp.Div) -> None:
+    """Displays every order with its details, loading the items and
+    products of each order when it is displayed."""
+    with db.session_scope() as session:
+        for order in session.query(model.Order) \
+                            .order_by(model.Order.order_id.desc()):
+            webapp.display_order(order, jp.Div(a=section_div), True)
+
+def measure(label: str, render, statements: list[int]) -> None:
+    section_div = jp.Div()
+    statements[0] = 0
+    start = time.perf_counter()
+    render(section_div)
+    elapsed = time.perf_counter() - start
+    print(f'  {label:22s} {elapsed*1e3:8.0f} ms, {statements[0]:6d} SQL '
+          f'statements, {count_components(section_div):7d} components')
+    section_div.delete()
+
+if __name__ == '__main__':
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    migrations.upgrade()
+    webapp = load_webapp()
+    add_orders(orders)
+    statements = [0]
+    event.listen(db.get_engine(), 'before_cursor_execute',
+                 lambda *args: statements.__setitem__(0, statements[0]+1))
+    print(f'Orders tab with {orders} orders')
+    measure('every order, detailed',
+            lambda div: display_every_order(webapp, div), statements)
+    measure('first page, rows',
+            lambda div: asyncio.run(webapp.display_all_orders(div)),
+            statements)
@@ -0,0 +1,100 @@
+"""Product search over 100,000 products.
+
+Times Product.search, which ranks matches from the ProductSearch full-text
+index, for several kinds of searches, against a LIKE scan over the same
+columns, which is neither ranked nor accent-insensitive.
+
+    python bench/product_search.py [products] [repetitions]
+"""
+import random
+import statistics
+import sys
+import time
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+from sqlalchemy import or_
+
+import database as db
+import migrations
+import model
+
+KINDS = ['Camiseta', 'Blusa', 'Falda', 'Pantalón', 'Collar', 'Pestañas',
+         'Delineador', 'Medias', 'Top', 'Chaqueta', 'Vestido', 'Aretes',
+         'Labial', 'Sudadera']
+ADJECTIVES = ['estampada', 'plisada', 'de cuadros', 'con calavera', 'gótica',
+              'kawaii', 'vintage', 'de encaje', 'oversize', 'corta', 'larga',
+              'brillante']
+THEMES = ['Sailor Moon', 'Kuromi', 'My Melody', 'Y2K', 'anime', 'esqueleto',
+          'corazones', 'estrellas', 'murciélagos', 'arañas']
+COLORS = ['Negro', 'Rojo', 'Rosa', 'Blanco', 'Morado', 'Azul', 'Verde',
+          'Lavanda']
+WORDS = ('material algodón poliéster talla única suave cómodo ideal para uso '
+         'diario lavar a mano edición limitada importado hecho a mano').split()
+SEARCHES = [
+    ('common word', 'camiseta', {}),
+    ('without accents', 'pestanas', {}),
+    ('prefix', 'murci', {}),
+    ('three words', 'falda cuadros negro', {}),
+    ('rare combination', 'kuromi lavanda encaje chaqueta', {}),
+    ('available only', 'vestido gotica', {'available_only': True}),
+    ('offset 1000', 'rosa', {'offset': 1000}),
+]
+
+def add_products(count: int) -> None:
+    """Adds count products with made-up names and descriptions to the copy
+    of the database, after the shop's own; the full-text index is filled by
+    its triggers, which need numeric IDs."""
+    random.seed(1)
+    categories = [category.value for category in model.Category]
+    with db.session_scope() as session:
+        session.execute(model.Product.__table__.insert(), [
+            {'product_id': f'{i:06d}',
+             'name': f'{random.choice(KINDS)} {random.choice(ADJECTIVES)} '
+                     f'{random.choice(THEMES)}',
+             'price': 10000.0, 'category': random.choice(categories),
+             'description': ' '.join(random.choices(WORDS, k=12)),
+             'images': 'a.jpg', 'colors': '-'.join(random.sample(COLORS, 3)),
+             'sizes': 'S-M-L', 'available_units': random.randint(0, 20)}
+            for i in range(100, 100+count)
+        ])
+
+def like_scan(word: str) -> list[model.Product]:
+    """First page of the products that contain a word, as a LIKE scan over
+    the searched columns finds them."""
+    pattern = f'%{word}%'
+    return db.get_table_objects(model.Product, or_(
+        model.Product.name.like(pattern),
+        model.Product.description.like(pattern),
+        model.Product.colors.like(pattern),
+        model.Product.category.like(pattern),
+    ))[:24]
+
+def measure(f, repetitions: int) -> tuple[float, float]:
+    """Returns median and 95th percentile of the time f takes, in ms."""
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        f()
+        times.append((time.perf_counter()-start) * 1e3)
+    times.sort()
+    return statistics.median(times), times[int(len(times)*0.95)-1]
+
+if __name__ == '__main__':
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    migrations.upgrade()
+    start = time.perf_counter()
+    add_products(products)
+    print(f'{products} products added in '
+          f'{time.perf_counter()-start:.1f} s, index included')
+    print(f'  {"search":20s} {"p50 ms":>8s} {"p95 ms":>8s}')
+    for label, query, options in SEARCHES:
+        p50, p95 = measure(lambda: model.Product.search(query, limit=24,
+                                                        **options),
+                           repetitions)
+        print(f'  {label:20s} {p50:8.1f} {p95:8.1f}')
+    p50, p95 = measure(lambda: like_scan('camiseta'), max(repetitions//5, 1))
+    print(f'  {"LIKE scan":20s} {p50:8.1f} {p95:8.1f}')
@@ -0,0 +1,48 @@
+"""Per-call overhead of the database helpers.
+
+Compares a primary-key lookup through a new engine and sessionmaker per
+call, as database.get_session() used to do, with the same lookup through
+the process-wide pooled engine and scoped sessions.
+
+    python bench/session_overhead.py [calls]
+"""
+import sys
+import time
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database as db
+import model
+
+def engine_per_call(key: str):
+    engine = create_engine('sqlite:///shop.db')
+    session = sessionmaker(bind=engine)()
+    try:
+        return session.get(model.Product, key)
+    finally:
+        session.close()
+
+def pooled(key: str):
+    return db.get_from_db(model.Product, key)
+
+def measure(f, calls: int) -> float:
+    """Returns mean seconds per call."""
+    f('000001')
+    start = time.perf_counter()
+    for _ in range(calls):
+        f('000001')
+    return (time.perf_counter()-start) / calls
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = measure(engine_per_call, calls)
+    after = measure(pooled, calls)
+    print(f'get_from_db, {calls} calls')
+    print(f'  engine per call: {before*1e6:8.0f} us/call')
+    print(f'  pooled engine:   {after*1e6:8.0f} us/call '
+          f'({before/after:.0f}x faster)')
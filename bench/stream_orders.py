@@ -0,0 +1,69 @@
+"""Time and peak memory of reading every order, and of reading one page of
+them, on a table of a million orders.
+
+Compares loading the whole table (get_table_objects) with streaming it in
+batches (stream_table_objects), with full objects and with four columns,
+and with fetching one page by key (get_page).
+
+    python bench/stream_orders.py [orders]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+import database as db
+import migrations
+import model
+
+Order = model.Order
+COLUMNS = [Order.order_id, Order.date, Order.status, Order.total]
+STATUSES = [status.value for status in model.OrderStatus]
+BATCH_SIZE = 10000
+
+def add_orders(count: int) -> None:
+    """Adds count synthetic orders to the copy of the database."""
+    with db.get_engine().begin() as connection:
+        for first in range(0, count, BATCH_SIZE):
+            connection.execute(Order.__table__.insert(), [
+                {'order_id': f'{i:07d}', 'total': 50000.0,
+                 'buyer_name': 'Compradora', 'buyer_email': 'c@ejemplo.com',
+                 'buyer_phone': '3000000000', 'ship_city': 'Barranquilla',
+                 'ship_department': 'Atlántico', 'ship_address': 'Calle 1',
+                 'ship_zipcode': '080001',
+                 'date': f'2023-{i%12+1:02d}-{i%28+1:02d}',
+                 'status': STATUSES[i % len(STATUSES)]}
+                for i in range(first, min(first+BATCH_SIZE, count))
+            ])
+
+def run(label: str, f) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = f()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'  {label:34s} {rows:>8} rows {elapsed:7.2f} s '
+          f'peak {peak/2**20:8.1f} MiB')
+
+if __name__ == '__main__':
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    migrations.upgrade()
+    add_orders(orders)
+    middle = f'{orders//2:07d}'
+    print(f'{orders} orders')
+    run('get_table_objects', lambda: len(db.get_table_objects(Order)))
+    run('stream_table_objects', lambda: sum(
+        1 for _ in db.stream_table_objects(Order)))
+    run('stream_table_objects, 4 columns', lambda: sum(
+        1 for _ in db.stream_table_objects(Order, columns=COLUMNS)))
+    run('get_page, 4 columns, middle', lambda: len(db.get_page(
+        Order, Order.order_id, after=middle, limit=50, columns=COLUMNS)[0]))
+    run('get_page, newest pending', lambda: len(db.get_page(
+        Order, Order.order_id, limit=50, descending=True, columns=COLUMNS,
+        condition=Order.status == model.OrderStatus.PENDING.value)[0]))
@@ -0,0 +1,59 @@
+"""Peak memory of receiving a 20 MB image and attaching it to a product.
+
+Compares receive_upload() and store_upload(), which write the body to disk
+as its chunks arrive, with joining the whole body in memory and passing it
+to store(), as images used to be stored. Chunks are made as they are sent,
+so only what each path holds is measured (tracemalloc).
+
+    python bench/upload_memory.py [megabytes]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from common import use_copy_of_shop
+
+use_copy_of_shop()
+
+import media
+import migrations
+
+# Size of the chunks a request body arrives in
+CHUNK_SIZE = 64 * 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+async def body(size: int, seed: int):
+    """Yields chunks of a PNG-looking body of the given size."""
+    chunk = bytes([seed]) * CHUNK_SIZE
+    yield PNG_SIGNATURE + chunk[len(PNG_SIGNATURE):]
+    for _ in range(size // CHUNK_SIZE - 1):
+        yield chunk
+
+def streamed(size: int) -> str:
+    name = asyncio.run(media.receive_upload(body(size, 1),
+                                            max_bytes=size))
+    return media.store_upload(name)
+
+def in_memory(size: int) -> str:
+    async def read() -> bytes:
+        return b''.join([chunk async for chunk in body(size, 2)])
+    return media.store(asyncio.run(read()), 'imagen.png')
+
+def run(label: str, f, size: int) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    f(size)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'  {label:28s} {elapsed*1e3:7.0f} ms, '
+          f'peak {peak/2**20:7.2f} MiB')
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = megabytes * 2**20
+    migrations.upgrade()
+    print(f'{megabytes} MB upload in {CHUNK_SIZE // 1024} KiB chunks')
+    run('whole body, store()', in_memory, size)
+    run('receive_upload, store_upload', streamed, size)
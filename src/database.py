@@ -1,119 +1,430 @@
 from __future__ import annotations
 
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+from typing import Any, Iterator
+import asyncio
+import inspect
+import threading
 
-from sqlalchemy import Column, Integer, create_engine, func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (Column, Integer, MetaData, Table, Text, create_engine,
+                        event, select, text, update)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
-def get_session() -> sessionmaker:
-    """Returns session to connect to the database."""
-    engine = create_engine('sqlite:///shop.db')
-    Session = sessionmaker(bind=engine)
-    return Session()
+# Connection settings, can be changed through configure_engine()
+DATABASE_URL = 'sqlite:///shop.db'
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_TIMEOUT = 30
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,   # Negative values are KiB, so roughly 16 MiB
+    'busy_timeout': 5000,   # Milliseconds
+}
+# Number of IDs each process reserves at once in get_new_id()
+ID_BLOCK_SIZE = 1
+MAX_ID = 10**9
+
+_engine = None
+# Identifies the request or event a session belongs to; sessions are shared
+# by every database call made within the same scope
+_current_scope: ContextVar[object | None] = ContextVar('db_scope',
+                                                       default=None)
+_session_registry = scoped_session(sessionmaker(expire_on_commit=False),
+                                   scopefunc=_current_scope.get)
+
+# Keeps the last ID handed out for every table that uses get_new_id();
+# created through the migrations module
+_sequences = Table(
+    'Sequences', MetaData(),
+    Column('name', Text, primary_key=True),
+    Column('value', Integer, nullable=False),
+)
+# Blocks of IDs reserved by this process, as (next ID, last ID) per table
+_id_blocks: dict[str, tuple[int, int]] = {}
+_id_blocks_lock = threading.Lock()
+# Runs database calls awaited by event handlers; one worker per pooled
+# connection, so workers do not wait for each other's connections
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE,
+                               thread_name_prefix='database')
+
+def _apply_pragmas(dbapi_connection, connection_record) -> None:
+    """Applies PRAGMAS to every new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    for pragma, value in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+def configure_engine(url: str = None, **pool_options) -> Engine:
+    """Creates the process-wide engine, replacing and disposing of any
+    previously created one.
+
+    Parameters:
+    url (str): Database URL. DATABASE_URL is used if not given.
+    pool_options: Overrides for pool_size, max_overflow and pool_timeout.
+
+    Returns:
+    Engine: Engine that every session will be bound to.
+    """
+    global _engine
+    dispose_engine()
+    options = {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+    }
+    options.update(pool_options)
+    _engine = create_engine(
+        url or DATABASE_URL,
+        poolclass=QueuePool,
+        connect_args={'check_same_thread': False},
+        **options,
+    )
+    event.listen(_engine, 'connect', _apply_pragmas)
+    _session_registry.configure(bind=_engine)
+    _id_blocks.clear()
+    return _engine
+
+def get_engine() -> Engine:
+    """Returns the process-wide engine, creating it on first use."""
+    if _engine is None:
+        return configure_engine()
+    return _engine
+
+def dispose_engine() -> None:
+    """Closes every pooled connection of the process-wide engine."""
+    global _engine
+    if _engine is not None:
+        _session_registry.remove()
+        _engine.dispose()
+        _engine = None
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """Provides a session that is committed when the block ends, rolled back
+    if an exception is raised and closed in both cases.
+
+    Nested scopes reuse the session of the outermost one, which is the only
+    one that commits and closes it.
+    """
+    if _current_scope.get() is not None:
+        yield _session_registry()
+        return
+    get_engine()
+    token = _current_scope.set(object())
+    session = _session_registry()
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        _session_registry.remove()
+        _current_scope.reset(token)
+
+def in_session_scope(f):
+    """Decorator that runs a request or event handler inside a single
+    session scope, so that every database call it makes shares one session
+    which is closed as soon as the handler returns."""
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_wrapper(*args, **kwargs):
+            with session_scope():
+                return await f(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with session_scope():
+            return f(*args, **kwargs)
+    return wrapper
 
 def add_to_db(object: Any) -> None:
     """Adds an object to database.
-    
+
     Parameter:
     object (Any): object which follows the schema for a database
     table.
     """
-    session = get_session()
-    session.add(object)
-    session.commit()
+    with session_scope() as session:
+        session.add(object)
+        session.flush()
 
 def delete_from_db(table_class, key: str) -> None:
-    """Deletes an object from a table in the database according to its 
+    """Deletes an object from a table in the database according to its
     primary key.
-    
+
     Parameters:
     table_class (class): Class that corresponds to a database table.
     key (str): Primary key of object to delete.
     """
-    session = get_session()
-    object = session.get(table_class, key)
-    session.delete(object)
-    session.commit()
-
-def get_from_db(table_class, key: str) -> Any | None:
-    """Fetches a row from a table in the database according to its 
-    primary key. 
-    
+    with session_scope() as session:
+        object = session.get(table_class, key)
+        session.delete(object)
+        session.flush()
+
+def get_from_db(table_class, key: str, options: list | None = None) -> Any | None:
+    """Fetches a row from a table in the database according to its
+    primary key.
+
     Returns row if found and None if not found.
-    
+
     Parameters:
     table_class (class): Class that corresponds to a database table.
     key (str): Primary key of the row to fetch.
-    
+    options (list): Loader options, such as selectinload(), for the
+    relationships that should be loaded alongside the row.
+
     Returns:
     Any: Row fetched from database.
     """
-    session = get_session()
-    return session.get(table_class, key)
+    with session_scope() as session:
+        return session.get(table_class, key, options=options)
 
 def get_table_objects(
         table_class: Any,
         condition: bool | None = None,
     ) -> list[Any]:
-    """Returns a list of rows from a table. 
-    
+    """Returns a list of rows from a table.
+
     If a condition is given, it returns only the rows that match said
     condition.
-    
+
     Parameters:
     table_class (class): Class that corresponds to a database table.
     condition (bool): Criteria by which table rows will be filtered.
     """
-    session = get_session()
-    if condition is None:
-        return session.query(table_class).all()
+    with session_scope() as session:
+        if condition is None:
+            return session.query(table_class).all()
+        else:
+            return session.query(table_class).filter(condition).all()
+
+def _query(session: Session, table_class: Any,
+           columns: list[Column] | None, condition: bool | None,
+           options: list | None = None):
+    """Returns query for the rows of a table, or only for some of their
+    columns if given, that match a condition."""
+    if columns is None:
+        query = session.query(table_class)
     else:
-        return session.query(table_class).filter(condition).all()
+        query = session.query(*columns)
+    if condition is not None:
+        query = query.filter(condition)
+    if options:
+        query = query.options(*options)
+    return query
+
+def stream_table_objects(
+        table_class: Any,
+        condition: bool | None = None,
+        columns: list[Column] | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Any]:
+    """Yields the rows of a table one at a time, fetching them from the
+    database batch_size rows at a time, so that the whole table is never
+    held in memory at once.
+
+    Rows are read through a session of their own rather than the current
+    session scope, so database calls made while consuming the generator
+    commit or roll back as usual, whether or not it is consumed to the end.
+    That session, and the connection it holds, stay open until the
+    generator is exhausted or closed, so it should not be left half
+    consumed.
+
+    Parameters:
+    table_class (class): Class that corresponds to a database table.
+    condition (bool): Criteria by which table rows will be filtered.
+    columns (list): Columns to load. If given, tuples with only those
+    columns are yielded instead of objects of table_class.
+    batch_size (int): Number of rows fetched from the database at a time.
+    """
+    # Never set as the current scope, since it is open across every yield
+    session = Session(bind=get_engine())
+    try:
+        query = _query(session, table_class, columns, condition)
+        yield from query.yield_per(batch_size)
+    finally:
+        session.close()
+
+def get_page(
+        table_class: Any,
+        key_column: Column,
+        after: Any | None = None,
+        limit: int = 20,
+        condition: bool | None = None,
+        columns: list[Column] | None = None,
+        descending: bool = False,
+        options: list | None = None,
+    ) -> tuple[list[Any], Any | None]:
+    """Returns a page of rows from a table ordered by a unique column,
+    alongside the cursor for the next page.
+
+    Pages are fetched by key (rows whose key comes after the cursor)
+    rather than by offset, so every page costs the same regardless of how
+    far into the table it is.
+
+    Parameters:
+    table_class (class): Class that corresponds to a database table.
+    key_column (Column): Unique column rows are ordered by.
+    after (Any): Cursor returned with the previous page. The first page is
+    returned if not given.
+    limit (int): Maximum number of rows in the page.
+    condition (bool): Criteria by which table rows will be filtered.
+    columns (list): Columns to load. If given, tuples with only those
+    columns are returned instead of objects of table_class; key_column is
+    added to them if missing.
+    descending (bool): Whether rows are ordered from greatest to least key.
+    options (list): Loader options, such as selectinload(), for the
+    relationships that should be loaded alongside the rows.
+
+    Returns:
+    tuple: Rows in the page and the cursor of the next page, which is None
+    if this is the last page.
+    """
+    if columns is not None and not any(column is key_column
+                                       for column in columns):
+        columns = [*columns, key_column]
+    with session_scope() as session:
+        query = _query(session, table_class, columns, condition, options)
+        if descending:
+            if after is not None:
+                query = query.filter(key_column < after)
+            query = query.order_by(key_column.desc())
+        else:
+            if after is not None:
+                query = query.filter(key_column > after)
+            query = query.order_by(key_column)
+        # Fetches one extra row to know whether there is a next page
+        rows = query.limit(limit+1).all()
+    if len(rows) > limit:
+        return rows[:limit], getattr(rows[limit-1], key_column.key)
+    return rows, None
 
 def row_count(table_class) -> int:
     """Returns number of rows of a table in the database.
-    
+
     Parameters:
     table_class (class): Class that corresponds to a database table.
     """
-    session = get_session()
-    return session.query(table_class).count()
+    with session_scope() as session:
+        return session.query(table_class).count()
+
+def _reserve_ids(session_or_connection, id_column: Column,
+                 amount: int) -> int:
+    """Advances the sequence of a table by the given amount and returns its
+    new value.
+
+    The sequence is seeded from the greatest ID stored in the table the first
+    time it is used. Since the UPDATE is the first write of the transaction,
+    SQLite holds the write lock from then on, so no other transaction can
+    obtain the same values before this one ends.
+    """
+    name = id_column.table.name
+    advance = (update(_sequences)
+               .where(_sequences.c.name == name)
+               .values(value=_sequences.c.value + amount))
+    if session_or_connection.execute(advance).rowcount == 0:
+        # Seeds the sequence with the greatest ID stored in the table
+        session_or_connection.execute(
+            text(f'INSERT OR IGNORE INTO Sequences (name, value) '
+                 f'SELECT :name, '
+                 f'COALESCE(MAX(CAST({id_column.name} AS INTEGER)), 0) '
+                 f'FROM {name}'),
+            {'name': name},
+        )
+        session_or_connection.execute(advance)
+    return session_or_connection.execute(
+        select(_sequences.c.value).where(_sequences.c.name == name)
+    ).scalar_one()
 
 def get_new_id(id_column: Column) -> str:
     """Returns ID for a new row in a database table.
-    
+
     The ID generated is a six-character string that is made up of a number
-    ranging from one to a million padded with zeroes on the left. This ID
-    will not be occupied by any other row in the table.
-    
+    ranging from one to MAX_ID padded with zeroes on the left. IDs are taken
+    from the Sequences table, so this ID will never be handed out twice, even
+    to concurrent transactions.
+
+    If called within a session scope, the ID is reserved in the same
+    transaction as the insert that uses it. If ID_BLOCK_SIZE is greater than
+    one, IDs are instead reserved in blocks, in their own transaction, and
+    handed out from memory until the block runs out.
+
     Parameters:
     id_column: Column of a database table that contains its ID.
-    
+
     Returns:
     str: Corresponds to the ID that should be assigned to a new row.
     """
-    session = get_session()
-    # Gets the maximmum value among stored IDs if these were integers
-    max_table_id = session.query(func.max(id_column.cast(Integer))).first()[0]
-    if max_table_id != None:    # Checks if column has data
-        if max_table_id < 10**9:
-            # Assigns max ID value increased by one unit and fills spaces to 
-            # the left with zeroes until resulting ID has a length of six
-            return str(max_table_id+1).zfill(6)
-        else:
-            # Starts from ID 000001 until finding an ID that does not 
-            # correspond to an already existing row in the given column
-            # if it does not find one, it returns an empty string
-            new_id_number = 1
-            repeated_id = id_column==str(new_id_number).zfill(6)
-            while (session.query(id_column).filter(repeated_id).first() is not None 
-                   and new_id_number<10**9):
-                new_id_number += 1
-                repeated_id = id_column==str(new_id_number).zfill(6)
-            if new_id_number >= 10**9:
-                return ''
-            else:
-                return str(new_id_number).zfill(6)
+    if ID_BLOCK_SIZE > 1:
+        with _id_blocks_lock:
+            name = id_column.table.name
+            next_id, last_id = _id_blocks.get(name, (1, 0))
+            if next_id > last_id:
+                with get_engine().begin() as connection:
+                    last_id = _reserve_ids(connection, id_column,
+                                           ID_BLOCK_SIZE)
+                next_id = last_id - ID_BLOCK_SIZE + 1
+            _id_blocks[name] = (next_id+1, last_id)
+            new_id = next_id
     else:
-        # Assigns starting ID value (000001)
-        return '1'.zfill(6)
\ No newline at end of file
+        with session_scope() as session:
+            new_id = _reserve_ids(session, id_column, 1)
+    if new_id > MAX_ID:
+        raise Exception('Límite de IDs alcanzado.')
+    return str(new_id).zfill(6)
+
+async def run_async(f, *args, **kwargs) -> Any:
+    """Runs a function that accesses the database in a worker thread and
+    awaits its result, so that the event loop keeps serving other sessions
+    while it runs.
+
+    The function runs in its own session scope, even if awaited within one,
+    since a session must not be shared between threads. Objects it returns
+    are detached from their session, so attributes that were not loaded
+    (such as relationships) cannot be read from them.
+    
+    Parameters:
+    f (function): Function to run.
+    args, kwargs: Arguments the function is called with.
+    """
+    loop = asyncio.get_running_loop()
+    # Executor threads do not inherit the caller's context, so the
+    # caller's session scope is not visible to the function
+    return await loop.run_in_executor(_executor, partial(f, *args, **kwargs))
+
+async def add_to_db_async(object: Any) -> None:
+    """Same as add_to_db, but awaitable. See run_async()."""
+    await run_async(add_to_db, object)
+
+async def delete_from_db_async(table_class, key: str) -> None:
+    """Same as delete_from_db, but awaitable. See run_async()."""
+    await run_async(delete_from_db, table_class, key)
+
+async def get_from_db_async(table_class, key: str,
+                            options: list | None = None) -> Any | None:
+    """Same as get_from_db, but awaitable. See run_async()."""
+    return await run_async(get_from_db, table_class, key, options)
+
+async def get_table_objects_async(
+        table_class: Any,
+        condition: bool | None = None,
+    ) -> list[Any]:
+    """Same as get_table_objects, but awaitable. See run_async()."""
+    return await run_async(get_table_objects, table_class, condition)
+
+async def row_count_async(table_class) -> int:
+    """Same as row_count, but awaitable. See run_async()."""
+    return await run_async(row_count, table_class)
+
+async def get_page_async(table_class: Any, key_column: Column,
+                         **options) -> tuple[list[Any], Any | None]:
+    """Same as get_page, but awaitable. See run_async()."""
+    return await run_async(get_page, table_class, key_column, **options)
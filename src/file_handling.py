@@ -1,51 +1,178 @@
 from __future__ import annotations
 
-def get_file_content(filename: str) -> dict[str, str]:
-    """Returns content from a text file in the form of a dict."""
+from contextlib import contextmanager
+from typing import Iterator
+import os
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writes are then only serialized within
+    # this process
+    fcntl = None
+
+# Seconds during which a cached file is served without checking whether it
+# changed on disk; with 0 it is checked (through a stat call) on every lookup
+REVALIDATE_INTERVAL = 0
+
+# Parsed content of every file read, as
+# filename: (modification time and size, time of last check, content)
+_cache: dict[str, tuple[tuple[int, int], float, dict[str, str]]] = {}
+_cache_lock = threading.Lock()
+_write_lock = threading.Lock()
+_counters = {'lookups': 0, 'reloads': 0}
+
+def _parse_lines(lines) -> dict[str, str]:
+    """Returns dict made from lines that follow the form field;content."""
     content = dict()
-    with open(file=f'{filename}', encoding='utf-8') as f:
-        while (line:=f.readline()) != '':
-            line = line.removesuffix('\n').split(';', 1)
+    for line in lines:
+        line = line.removesuffix('\n').split(';', 1)
+        if len(line) == 2:
             content[line[0]] = line[1]
     return content
 
+def _parse_file(filename: str) -> dict[str, str]:
+    """Reads a text file whose lines follow the form field;content into a
+    dict."""
+    with open(file=f'{filename}', encoding='utf-8') as f:
+        return _parse_lines(f)
+
+def _file_signature(filename: str) -> tuple[int, int]:
+    """Returns modification time and size of a file."""
+    st = os.stat(filename)
+    return (st.st_mtime_ns, st.st_size)
+
+def get_cached_content(filename: str) -> dict[str, str]:
+    """Returns parsed content of a file, reading it again only if it has
+    changed since it was cached.
+
+    The dict returned is shared and must not be modified. The same dict is
+    returned for as long as the file does not change.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        _counters['lookups'] += 1
+        entry = _cache.get(filename)
+        if entry is not None and now-entry[1] < REVALIDATE_INTERVAL:
+            return entry[2]
+        signature = _file_signature(filename)
+        if entry is not None and entry[0] == signature:
+            content = entry[2]
+        else:
+            content = _parse_file(filename)
+            _counters['reloads'] += 1
+        _cache[filename] = (signature, now, content)
+        return content
+
+def cache_metrics() -> dict[str, int]:
+    """Returns number of cached files and counters of lookups and of reloads
+    from disk."""
+    with _cache_lock:
+        return {'files': len(_cache), **_counters}
+
+def get_file_content(filename: str) -> dict[str, str]:
+    """Returns content from a text file in the form of a dict."""
+    return dict(get_cached_content(filename))
+
+def _format_line(field: str, info: str) -> str:
+    """Returns line of a text file for a field and its content."""
+    # Line breaks would split the field across lines
+    info = ' '.join(str(info).splitlines())
+    return f'{field};{info}\n'
+
+@contextmanager
+def _locked(filename: str) -> Iterator[None]:
+    """Holds the write lock of a file, shared by threads of this process
+    and, where supported, by other processes through a lock file."""
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f'{filename}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_fields(filename: str, changes: dict[str, str],
+                 add_missing: bool = False) -> None:
+    """Overwrites information of several fields in a text file at once.
+
+    The new content is written to a temporary file that then replaces the
+    original, so readers see either the previous file or the new one, never
+    a partially written one.
+
+    Parameters:
+    filename (str): Name of the text file.
+    changes (dict): New content of each field to change, by field name.
+    add_missing (bool): Whether fields that are not in the file are added at
+    its end or ignored.
+    """
+    with _locked(filename):
+        new_lines = []
+        written_fields = set()
+        with open(file=filename, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                field_in_line = line.split(';', 1)[0]
+                if field_in_line in changes:
+                    new_lines.append(_format_line(field_in_line,
+                                                  changes[field_in_line]))
+                    written_fields.add(field_in_line)
+                else:
+                    new_lines.append(line + '\n')
+        if add_missing:
+            for field, new_info in changes.items():
+                if field not in written_fields:
+                    new_lines.append(_format_line(field, new_info))
+        new_file_content = ''.join(new_lines)
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp',
+                                         prefix=f'.{os.path.basename(filename)}.')
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(new_file_content)
+                f.flush()
+                os.fsync(f.fileno())
+            # Temporary files are only readable by their owner
+            os.chmod(temp_name, stat.S_IMODE(os.stat(filename).st_mode))
+            os.replace(temp_name, filename)
+        except:
+            os.remove(temp_name)
+            raise
+        # Updates cached content with what was written
+        with _cache_lock:
+            _cache[filename] = (_file_signature(filename), time.monotonic(),
+                                _parse_lines(new_lines))
+
 def write_over_file(filename: str, field: str, new_info: str) -> None:
     """Overwrites information of a specific field in a text file.
-    
+
     Parameters:
     filename (str): Name of the text file.
     field (str): Name of the field whose content will be changed.
-    new_info (str): String that will replace the previous content of 
+    new_info (str): String that will replace the previous content of
     the field.
     """
-    f = open(file=filename, mode='r', encoding='utf-8')
-    new_file_content = ''
-    for line in f:
-        line = line.strip()
-        if (field_in_line:=line.split(';', 1)[0]) == field:
-            new_file_content += f'{field_in_line};{new_info}\n'
-        else:
-            new_file_content += line + '\n'
-    f.close()
-    f = open(filename, 'w')
-    f.write(new_file_content)
-    f.close()
+    write_fields(filename, {field: new_info})
 
 def get_content_by_field(filename: str, field: str) -> str:
     """Returns content that corresponds to a specific field in a text file.
-    
+
     Parameters:
     filename (str): Name of the text file.
     field (str): Name of the field whose content will be returned.
-    
+
     Returns:
     str: Content of the specified field.
     """
-    with open(file=filename, encoding='utf-8') as f:
-        line = f.readline()
-        while line!='' and line.split(';', 1)[0]!=field:
-            line = f.readline()
-        if line != '':
-            return line.split(';', 1)[1].strip()
-        else:
-            return None
\ No newline at end of file
+    content = get_cached_content(filename).get(field)
+    if content is not None:
+        return content.strip()
+    else:
+        return None
@@ -1,12 +1,61 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+
 import argon2
 import file_handling as file
 
 _hasher = argon2.PasswordHasher(time_cost=3, memory_cost=64*1024, salt_len=16,
                                 parallelism=1, hash_len=32, encoding='utf-8')
 
+# Number of Argon2 computations that may run at once; each one takes
+# memory_cost KiB of memory. Further requests wait for a free worker.
+MAX_CONCURRENT_HASHES = 2
+# Number of Argon2 computations that may be running or waiting at once;
+# requests beyond it are rejected instead of queued
+MAX_PENDING_HASHES = 8
+# Argon2 releases the GIL while it runs, so threads are enough to keep it
+# off the event loop
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_HASHES,
+                               thread_name_prefix='argon2')
+_pending_lock = threading.Lock()
+_counters = {'pending': 0, 'completed': 0, 'rejected': 0}
+
+def hash_metrics() -> dict[str, int]:
+    """Returns number of Argon2 computations running or waiting alongside
+    counters of completed and rejected ones."""
+    with _pending_lock:
+        return dict(_counters)
+
+async def _run_in_executor(f, *args):
+    """Runs a blocking function in the Argon2 executor and awaits its
+    result.
+
+    Raises an exception without running it if MAX_PENDING_HASHES
+    computations are already running or waiting.
+    """
+    with _pending_lock:
+        if _counters['pending'] >= MAX_PENDING_HASHES:
+            _counters['rejected'] += 1
+            raise Exception('El servidor está ocupado. Intente de nuevo en '
+                            'unos segundos.')
+        _counters['pending'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, f, *args)
+    finally:
+        with _pending_lock:
+            _counters['pending'] -= 1
+            _counters['completed'] += 1
+
 def verify_password(string: str) -> bool:
     """Returns True if the string matches the stored password or False
     if not.
+
+    The stored hash is only replaced if it was made with parameters other
+    than the current ones.
         
     Parameters:
     string (str): String to compare to stored password.
@@ -14,10 +63,20 @@ def verify_password(string: str) -> bool:
     stored_password_hash = file.get_content_by_field('admin.txt', 'Clave')
     try:
         _hasher.verify(stored_password_hash, string)
-        file.write_over_file('admin.txt', 'Clave', _hasher.hash(string))
-        return True
     except:
         return False
+    if _hasher.check_needs_rehash(stored_password_hash):
+        file.write_over_file('admin.txt', 'Clave', _hasher.hash(string))
+    return True
+
+async def verify_password_async(string: str) -> bool:
+    """Same as verify_password, but runs in the Argon2 executor so that the
+    event loop is not blocked while the hash is computed.
+        
+    Parameters:
+    string (str): String to compare to stored password.
+    """
+    return await _run_in_executor(verify_password, string)
 
 def change_account_info(*, current_password: str, new_password: str = None,
                         new_user: str = None) -> None:
@@ -32,23 +91,40 @@ def change_account_info(*, current_password: str, new_password: str = None,
     if current_password != None:
         if verify_password(current_password):
             if not(new_user==None and new_password==None):
+                changes = {}
                 if new_user != None:
                     # Checks if new user abides by rules, modifies it if so and raises exception if not
                     if new_user.strip()!="" and new_user.isascii() and new_user.isalnum():
-                        file.write_over_file('admin.txt', 'Usuario', new_user)
+                        changes['Usuario'] = new_user
                     else:
                         raise Exception('El usuario no puede contener tildes, espacios o demás caracteres especiales.')
                 if new_password != None:
                     # Checks if new user abides by rules, modifies it if so and raises exception if not
                     if new_password.strip()!="" and new_password.isascii() and new_password.isalnum():
                         # Modifies stored password hash
-                        new_password_hash = _hasher.hash(new_password)
-                        file.write_over_file('admin.txt', 'Clave', new_password_hash)
+                        changes['Clave'] = _hasher.hash(new_password)
                     else:
                         raise Exception('La contraseña no puede contener tildes, espacios o demás caracteres especiales.')
+                # Writes all changes at once
+                file.write_fields('admin.txt', changes)
             else:
                 raise Exception('No se ingresó ningún campo a cambiar.')
         else:
             raise Exception('La contraseña ingresada es incorrecta.')
     else:
-        raise Exception('No se ingresó contraseña actual.')
\ No newline at end of file
+        raise Exception('No se ingresó contraseña actual.')
+
+async def change_account_info_async(*, current_password: str,
+                                    new_password: str = None,
+                                    new_user: str = None) -> None:
+    """Same as change_account_info, but runs in the Argon2 executor so that
+    the event loop is not blocked while hashes are computed.
+        
+    Parameters:
+    current_password (str): Currently stored password.
+    new_password (str): New password to store.
+    new_user (str): New user to store.
+    """
+    await _run_in_executor(lambda: change_account_info(
+        current_password=current_password, new_password=new_password,
+        new_user=new_user))
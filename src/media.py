@@ -0,0 +1,681 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterable, Iterable
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import (Column, Integer, MetaData, Table, Text, select, text,
+                        update)
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.routing import Mount
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import database as db
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    # Without Pillow no derivatives are made and views use the originals
+    Image = None
+
+MEDIA_DIR = 'media'
+DERIVED_DIR = f'{MEDIA_DIR}/derived'
+# Uploaded images wait here until they are attached to a product
+UPLOAD_DIR = f'{MEDIA_DIR}/uploads'
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+# Width in pixels of each derivative, by size name
+SIZES = {
+    'thumb': 160,
+    'grid': 480,
+    'detail': 1200,
+}
+QUALITY = 80
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# Pillow may be built without WebP support, in which case JPEG is used
+if Image is not None and features.check('webp'):
+    FORMAT, EXTENSION = 'WEBP', 'webp'
+else:
+    FORMAT, EXTENSION = 'JPEG', 'jpg'
+
+# Files named after their content never change, so clients may keep them
+# for as long as they like; other files are checked again on every use
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Files in MEDIA_DIR the pages link to directly, which are never removed
+SITE_FILES = frozenset({'logo.png', 'icon_Instagram.png', 'icon_TikTok.png'})
+# Names of files stored by store(): content hash and extension, or content
+# hash and width for their derivatives
+_content_name = re.compile(r'^(?:derived/)?[0-9a-f]{32}(?:_[0-9]+)?\.[a-z0-9]+$')
+# Names of files in UPLOAD_DIR, which are also content names
+_upload_name = re.compile(r'^[0-9a-f]{32}\.[a-z]+$')
+# Leading bytes of each type of image accepted for upload, with the
+# extension it is stored with; WebP files start with RIFF, their size and
+# then WEBP
+_signatures = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+]
+_HEAD_BYTES = 12
+
+_metadata = MetaData()
+# Number of products that use each file stored by store()
+_references = Table(
+    'MediaReferences', _metadata,
+    Column('name', Text, primary_key=True),
+    Column('refcount', Integer, nullable=False),
+)
+# Images of every product, as names joined by '-'; mapped here since model
+# depends on this module
+_products = Table(
+    'Products', _metadata,
+    Column('product_id', Integer, primary_key=True),
+    Column('images', Text),
+)
+
+# Resizing and encoding release the GIL, so threads are enough to keep
+# them off the event loop
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='media')
+# Names of derivatives known to exist
+_existing: set[str] = set()
+_existing_lock = threading.Lock()
+
+def derivative_name(image: str, size: str) -> str:
+    """Returns name, relative to MEDIA_DIR, of a derivative of an image.
+
+    The name includes the derivative's width rather than the name of its
+    size, so that changing a width never serves an old derivative under a
+    name clients have cached.
+
+    Parameters:
+    image (str): Name of the original image in MEDIA_DIR.
+    size (str): Name of the size of the derivative, a key of SIZES.
+    """
+    stem = os.path.splitext(image)[0]
+    return f'derived/{stem}_{SIZES[size]}.{EXTENSION}'
+
+def url(image: str, size: str | None = None) -> str:
+    """Returns URL of an image, or of one of its derivatives if given a
+    size and the derivative has been made.
+
+    Parameters:
+    image (str): Name of the original image in MEDIA_DIR.
+    size (str): Name of the size of the derivative, a key of SIZES.
+    """
+    if size is not None:
+        name = derivative_name(image, size)
+        if name in _existing or os.path.exists(f'{MEDIA_DIR}/{name}'):
+            with _existing_lock:
+                _existing.add(name)
+            return f'/static/{MEDIA_DIR}/{name}'
+    return f'/static/{MEDIA_DIR}/{image}'
+
+def _write(path: str, write) -> None:
+    """Writes a file through a temporary file, so that the path never
+    holds a partially written file.
+
+    Parameters:
+    path (str): Path of the file.
+    write (function): Writes the content to the binary file it is given.
+    """
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_name, path)
+    except:
+        os.remove(temp_name)
+        raise
+
+def _save(derivative, path: str) -> None:
+    """Saves an image to a path in FORMAT."""
+    _write(path, lambda f: derivative.save(f, FORMAT, quality=QUALITY,
+                                           optimize=True))
+
+def content_name(content: bytes, original_name: str) -> str:
+    """Returns name a file is stored under: the hash of its content
+    followed by the extension of its original name.
+
+    Parameters:
+    content (bytes): Content of the file.
+    original_name (str): Name the file was uploaded with.
+    """
+    extension = os.path.splitext(original_name)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]+', extension):
+        extension = '.bin'
+    return hashlib.sha256(content).hexdigest()[:32] + extension
+
+def _add_reference(name: str) -> None:
+    """Records one more reference to a file in MEDIA_DIR."""
+    with db.session_scope() as session:
+        session.execute(
+            text('INSERT INTO MediaReferences (name, refcount) '
+                 'VALUES (:name, 1) '
+                 'ON CONFLICT (name) DO UPDATE SET refcount = refcount + 1'),
+            {'name': name},
+        )
+
+def store(content: bytes, original_name: str) -> str:
+    """Stores a file in MEDIA_DIR under its content name and records one
+    more reference to it. Identical files are only stored once.
+
+    If called within a session scope, the reference is recorded in the
+    same transaction.
+
+    Parameters:
+    content (bytes): Content of the file.
+    original_name (str): Name the file was uploaded with.
+
+    Returns:
+    str: Name of the stored file in MEDIA_DIR.
+    """
+    name = content_name(content, original_name)
+    path = f'{MEDIA_DIR}/{name}'
+    if os.path.exists(path):
+        # Keeps the collector from removing it while it is reused
+        os.utime(path)
+    else:
+        _write(path, lambda f: f.write(content))
+    _add_reference(name)
+    return name
+
+def image_extension(head: bytes) -> str | None:
+    """Returns extension of the type of image a file is, judging by its
+    first bytes, or None if it is not a JPEG, PNG, GIF or WebP image.
+
+    Parameters:
+    head (bytes): At least the first 12 bytes of the file.
+    """
+    for signature, extension in _signatures:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+async def receive_upload(chunks: AsyncIterable[bytes],
+                         max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Writes an uploaded image to UPLOAD_DIR as its chunks arrive, so that
+    only one chunk is held in memory at a time.
+
+    The upload is rejected as soon as its first bytes show it is not an
+    image, or as soon as it grows past max_bytes, and nothing is kept.
+
+    Parameters:
+    chunks: Content of the file, such as the body of a request.
+    max_bytes (int): Size limit of the file.
+
+    Returns:
+    str: Name of the file in UPLOAD_DIR, which store_upload() takes to
+    attach it to a product.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.tmp')
+    digest = hashlib.sha256()
+    head = b''
+    extension = None
+    size = 0
+    try:
+        with open(fd, 'wb') as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise Exception('La imagen supera el tamaño máximo de '
+                                    f'{max_bytes // 2**20} MB.')
+                if extension is None and len(head) < _HEAD_BYTES:
+                    head += chunk[:_HEAD_BYTES-len(head)]
+                    if len(head) == _HEAD_BYTES:
+                        extension = image_extension(head)
+                        if extension is None:
+                            raise Exception('El archivo no es una imagen '
+                                            'JPEG, PNG, GIF o WebP.')
+                digest.update(chunk)
+                f.write(chunk)
+        if extension is None:
+            raise Exception('El archivo no es una imagen JPEG, PNG, GIF o '
+                            'WebP.')
+        name = digest.hexdigest()[:32] + extension
+        os.replace(temp_name, f'{UPLOAD_DIR}/{name}')
+    except:
+        os.remove(temp_name)
+        raise
+    return name
+
+def store_upload(name: str) -> str:
+    """Moves an image received by receive_upload() to MEDIA_DIR and records
+    one more reference to it, like store() does for content in memory.
+
+    If called within a session scope, the reference is recorded in the
+    same transaction.
+
+    Parameters:
+    name (str): Name of the file in UPLOAD_DIR.
+
+    Returns:
+    str: Name of the stored file in MEDIA_DIR.
+    """
+    if not _upload_name.match(name):
+        raise Exception('Imagen no válida.')
+    upload_path = f'{UPLOAD_DIR}/{name}'
+    path = f'{MEDIA_DIR}/{name}'
+    if os.path.exists(upload_path):
+        if os.path.exists(path):
+            # Identical images are only stored once
+            os.remove(upload_path)
+            os.utime(path)
+        else:
+            os.replace(upload_path, path)
+    elif os.path.exists(path):
+        os.utime(path)
+    else:
+        raise Exception('La imagen ya no está disponible. Súbala de nuevo.')
+    _add_reference(name)
+    return name
+
+def release(name: str) -> bool:
+    """Records one less reference to a file stored by store().
+
+    If called within a session scope, the reference is removed in the same
+    transaction.
+
+    Parameters:
+    name (str): Name of the file in MEDIA_DIR.
+
+    Returns:
+    bool: True if the file is no longer used and can be removed. Files not
+    stored by store() are only used by one product, so True is returned
+    for them too.
+    """
+    with db.session_scope() as session:
+        session.execute(
+            update(_references)
+            .where(_references.c.name == name)
+            .values(refcount=_references.c.refcount - 1)
+        )
+        refcount = session.execute(
+            _references.select().where(_references.c.name == name)
+        ).first()
+        if refcount is None:
+            return True
+        if refcount.refcount > 0:
+            return False
+        session.execute(
+            _references.delete().where(_references.c.name == name)
+        )
+        return True
+
+def _remove_file(name: str) -> int:
+    """Removes a file from MEDIA_DIR if it exists.
+
+    Parameters:
+    name (str): Name of the file, relative to MEDIA_DIR.
+
+    Returns:
+    int: Size of the removed file in bytes, 0 if it did not exist.
+    """
+    with _existing_lock:
+        _existing.discard(name)
+    path = f'{MEDIA_DIR}/{name}'
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+def remove(name: str) -> int:
+    """Removes a file from MEDIA_DIR alongside its derivatives, ignoring
+    those that do not exist.
+
+    Parameters:
+    name (str): Name of the file in MEDIA_DIR.
+
+    Returns:
+    int: Bytes freed.
+    """
+    return sum(_remove_file(path) for path in
+               [name] + [derivative_name(name, size) for size in SIZES])
+
+def make_derivatives(image: str, overwrite: bool = False) -> list[str]:
+    """Makes a resized, compressed copy of an image for every size in
+    SIZES. Images are never enlarged, so derivatives of small images keep
+    their original width.
+
+    Parameters:
+    image (str): Name of the original image in MEDIA_DIR.
+    overwrite (bool): Whether derivatives that already exist are made
+    again.
+
+    Returns:
+    list: Names of the derivatives made.
+    """
+    if Image is None:
+        return []
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    made = []
+    with Image.open(f'{MEDIA_DIR}/{image}') as original:
+        # Applies the orientation phone cameras store as metadata
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA') or FORMAT == 'JPEG':
+            original = original.convert('RGB')
+        for size, width in SIZES.items():
+            name = derivative_name(image, size)
+            path = f'{MEDIA_DIR}/{name}'
+            if not overwrite and os.path.exists(path):
+                continue
+            derivative = original.copy()
+            derivative.thumbnail((width, width*4))
+            _save(derivative, path)
+            made.append(name)
+    with _existing_lock:
+        _existing.update(made)
+    return made
+
+def schedule_derivatives(images: Iterable[str]) -> list[Future]:
+    """Makes the derivatives of images in the worker pool, without waiting
+    for them. Views use the original images until then.
+
+    Parameters:
+    images: Names of original images in MEDIA_DIR.
+    """
+    return [_executor.submit(make_derivatives, image) for image in images]
+
+def backfill(images: Iterable[str] | None = None) -> tuple[int, list[str]]:
+    """Makes the missing derivatives of existing images.
+
+    Parameters:
+    images: Names of the images in MEDIA_DIR. Every file directly in
+    MEDIA_DIR with one of IMAGE_EXTENSIONS is used if not given.
+
+    Returns:
+    tuple: Number of derivatives made and names of the images that could
+    not be read.
+    """
+    if images is None:
+        images = sorted(entry.name for entry in os.scandir(MEDIA_DIR)
+                        if entry.is_file() and entry.name.lower()
+                        .endswith(IMAGE_EXTENSIONS))
+    made = 0
+    failed = []
+    for image in images:
+        try:
+            made += len(make_derivatives(image))
+        except:
+            failed.append(image)
+    return made, failed
+
+def convert_product_images() -> int:
+    """Stores every product image that is not named after its content yet
+    under its content name, links products to the new names and removes
+    the old files.
+
+    Returns:
+    int: Number of images converted.
+    """
+    # Imported here since model depends on this module
+    import model
+    converted = {}
+    with db.session_scope() as session:
+        for product in session.query(model.Product):
+            images = []
+            for image in product.images.split('-'):
+                path = f'{MEDIA_DIR}/{image}'
+                if _content_name.match(image) or not os.path.isfile(path):
+                    images.append(image)
+                    continue
+                with open(path, 'rb') as f:
+                    images.append(store(f.read(), image))
+                converted[image] = images[-1]
+            product.images = '-'.join(images)
+    # Old files are only removed once products point to the new ones
+    for image in converted:
+        remove(image)
+    model.catalogue.load()
+    return len(converted)
+
+
+class MediaCollector():
+    """Removes files from MEDIA_DIR that no product uses.
+
+    Only files this module makes or that deleted products released are
+    ever removed: originals named after their content that no product links
+    to, derivatives of images that are gone or of sizes no longer in SIZES,
+    uploads that were never attached, temporary files left by interrupted
+    writes and images of deleted products that no other product uses.
+    Other files, such as the ones in SITE_FILES, are kept.
+
+    Files modified less than grace_period seconds ago are kept too, since
+    they may belong to a product that is still being added. Each sweep
+    checks at most batch_size files, so that a large folder is reconciled
+    over several sweeps without holding up anything else. Files released by
+    deleted products are queued and checked ahead of the rest.
+    """
+
+    def __init__(self, *, grace_period: float = 60*60,
+                 batch_size: int = 200) -> None:
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self._queue: deque[str] = deque()
+        # Files still to be checked in the current pass over MEDIA_DIR
+        self._pending: list[str] = []
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._sweeper = None
+        self._counters = {'checked': 0, 'removed': 0, 'reclaimed_bytes': 0,
+                          'passes': 0}
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        """Returns number of queued files alongside counters of files
+        checked and removed, bytes reclaimed and completed passes over
+        MEDIA_DIR."""
+
+        with self._lock:
+            return {'queued': len(self._queue), **self._counters}
+
+    def queue(self, names: Iterable[str]) -> None:
+        """Queues originals, alongside their derivatives, to be removed on
+        the next sweep if no product uses them by then.
+
+        Parameters:
+        names: Names of the originals in MEDIA_DIR.
+        """
+
+        names = list(names)
+        with self._lock:
+            for name in names:
+                self._queue.append(name)
+                self._queue.extend(derivative_name(name, size)
+                                   for size in SIZES)
+
+    def sweep(self) -> int:
+        """Checks queued files and then the next batch_size files of the
+        current pass over MEDIA_DIR, removing those that are unused.
+
+        Returns:
+        int: Bytes reclaimed.
+        """
+
+        with self._sweep_lock:
+            with self._lock:
+                released = set(self._queue)
+                batch = list(self._queue)
+                self._queue.clear()
+                if not self._pending:
+                    self._pending = self._list_files()
+                batch += self._pending[-self.batch_size:]
+                del self._pending[-self.batch_size:]
+                if not self._pending:
+                    self._counters['passes'] += 1
+            if not batch:
+                return 0
+            used = self._used_files()
+            now = time.time()
+            removed = 0
+            reclaimed = 0
+            for name in batch:
+                if self._is_orphan(name, used, now, name in released):
+                    size = _remove_file(name)
+                    if size > 0:
+                        removed += 1
+                        reclaimed += size
+            with self._lock:
+                self._counters['checked'] += len(batch)
+                self._counters['removed'] += removed
+                self._counters['reclaimed_bytes'] += reclaimed
+            return reclaimed
+
+    def collect(self) -> int:
+        """Sweeps until a whole pass over MEDIA_DIR is completed.
+
+        Returns:
+        int: Bytes reclaimed.
+        """
+
+        with self._lock:
+            # Starts a new pass
+            self._pending = []
+        reclaimed = self.sweep()
+        while self._pending:
+            reclaimed += self.sweep()
+        return reclaimed
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        """Starts a background thread that calls sweep() every interval
+        seconds.
+
+        Parameters:
+        interval (float): Seconds between sweeps.
+        """
+
+        if self._sweeper is not None:
+            return
+        def sweep_periodically() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except:
+                    # Tries again on the next sweep
+                    pass
+        self._sweeper = threading.Thread(target=sweep_periodically,
+                                         name='media-collector', daemon=True)
+        self._sweeper.start()
+
+    def _list_files(self) -> list[str]:
+        """Returns names, relative to MEDIA_DIR, of the files in MEDIA_DIR
+        and in the folders this module makes within it."""
+
+        names = []
+        for directory in (MEDIA_DIR, DERIVED_DIR, UPLOAD_DIR):
+            prefix = os.path.relpath(directory, MEDIA_DIR) + '/'
+            prefix = '' if prefix == './' else prefix
+            try:
+                names += [prefix + entry.name
+                          for entry in os.scandir(directory)
+                          if entry.is_file()]
+            except FileNotFoundError:
+                pass
+        return names
+
+    def _used_files(self) -> set[str]:
+        """Returns names of the originals products use, or that are still
+        referenced, of SITE_FILES and of the derivatives of all of them."""
+
+        with db.session_scope() as session:
+            used = set(session.execute(
+                select(_references.c.name).where(_references.c.refcount > 0)
+            ).scalars())
+            for images in session.execute(select(_products.c.images)
+                                          ).scalars():
+                if images:
+                    used.update(images.split('-'))
+        used.update(SITE_FILES)
+        used.update([derivative_name(image, size)
+                     for image in used for size in SIZES])
+        return used
+
+    def _is_orphan(self, name: str, used: set[str], now: float,
+                   released: bool = False) -> bool:
+        """Returns True if a file can be removed. Files not named after
+        their content can only be removed if a deleted product released
+        them."""
+
+        if name in used:
+            return False
+        in_upload_dir = name.startswith(
+            os.path.relpath(UPLOAD_DIR, MEDIA_DIR) + '/')
+        if not (released or _content_name.match(name) or in_upload_dir
+                or name.endswith('.tmp')):
+            return False
+        try:
+            modified = os.path.getmtime(f'{MEDIA_DIR}/{name}')
+        except FileNotFoundError:
+            return False
+        return now-modified > self.grace_period
+
+
+collector = MediaCollector()
+
+
+class MediaFiles(StaticFiles):
+    """Static files application for MEDIA_DIR.
+
+    Files named after their content are sent with headers that let clients
+    cache them indefinitely, with their content hash as ETag. Other files
+    must be revalidated, which costs a 304 response if they did not change.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result,
+                      scope, status_code: int = 200) -> Response:
+        response = FileResponse(full_path, status_code=status_code,
+                                stat_result=stat_result,
+                                method=scope['method'])
+        name = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+        if _content_name.match(name):
+            response.headers['cache-control'] = IMMUTABLE_CACHE_CONTROL
+            # The name already identifies the content
+            response.headers['etag'] = f'"{name}"'
+        else:
+            response.headers['cache-control'] = REVALIDATE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def mount(app) -> None:
+    """Serves MEDIA_DIR from /static/media through MediaFiles, ahead of
+    the application's other static files.
+
+    Parameters:
+    app (Starlette): Application to serve the files from.
+    """
+    app.routes.insert(0, Mount(f'/static/{MEDIA_DIR}',
+                               app=MediaFiles(directory=MEDIA_DIR)))
+
+
+if __name__ == '__main__':
+    # One-off command, run from the repository root:
+    #     python src/media.py
+    import migrations
+    migrations.upgrade()
+    converted = convert_product_images()
+    print(f'Se renombraron {converted} imágenes según su contenido.')
+    reclaimed = collector.collect()
+    print(f'Se liberaron {reclaimed / 2**20:.1f} MB de imágenes sin usar.')
+    if Image is None:
+        sys.exit('Pillow no está instalado.')
+    made, failed = backfill()
+    print(f'Se crearon {made} imágenes derivadas.')
+    for image in failed:
+        print(f'No se pudo procesar {image}.')
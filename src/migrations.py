@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+import database as db
+
+# Ordered list of schema changes as (version, description, statements).
+# Versions must increase by one and a migration must never be edited once
+# released; changes to the schema are added as a new migration instead.
+# Statements must be safe to run again (IF NOT EXISTS and the like), as the
+# SQLite driver does not include DDL in the migration's transaction.
+MIGRATIONS = [
+    (1, 'Adds indexes used by the catalogue, order and admin queries', [
+        'CREATE INDEX IF NOT EXISTS ix_orderitems_order_id '
+        'ON OrderItems (order_id)',
+        'CREATE INDEX IF NOT EXISTS ix_orderitems_product_id '
+        'ON OrderItems (product_id)',
+        'CREATE INDEX IF NOT EXISTS ix_products_category_available_units '
+        'ON Products (category, available_units)',
+        'CREATE INDEX IF NOT EXISTS ix_orders_status_date '
+        'ON Orders (status, date)',
+    ]),
+    (2, 'Adds table that keeps visitors\' carts across restarts', [
+        'CREATE TABLE IF NOT EXISTS Carts ('
+        'session_id TEXT PRIMARY KEY, '
+        'items TEXT NOT NULL, '
+        'last_access FLOAT NOT NULL)',
+    ]),
+    (3, 'Adds table that holds stock reserved by carts', [
+        'CREATE TABLE IF NOT EXISTS StockReservations ('
+        'session_id TEXT NOT NULL, '
+        'product_id TEXT NOT NULL, '
+        'quantity INTEGER NOT NULL, '
+        'expires_at FLOAT NOT NULL, '
+        'PRIMARY KEY (session_id, product_id), '
+        'FOREIGN KEY(product_id) REFERENCES Products(product_id))',
+        'CREATE INDEX IF NOT EXISTS ix_stockreservations_product_id '
+        'ON StockReservations (product_id, expires_at)',
+    ]),
+    (4, 'Adds table that keeps admin sessions across restarts', [
+        'CREATE TABLE IF NOT EXISTS AdminSessions ('
+        'session_id TEXT PRIMARY KEY, '
+        'created_at FLOAT NOT NULL, '
+        'last_access FLOAT NOT NULL)',
+    ]),
+    (5, 'Adds table that counts the products using each media file', [
+        'CREATE TABLE IF NOT EXISTS MediaReferences ('
+        'name TEXT PRIMARY KEY, '
+        'refcount INTEGER NOT NULL)',
+    ]),
+    (6, 'Adds full-text index of products kept in sync by triggers', [
+        # Rows share their rowid with the product's numeric ID, so that
+        # triggers find them without scanning the index
+        'CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5('
+        'product_id UNINDEXED, name, description, colors, category, '
+        "tokenize = 'unicode61 remove_diacritics 2')",
+        # Weights of each column in the BM25 ranking, as used by ORDER BY
+        # rank; names weigh the most
+        "INSERT INTO ProductSearch (ProductSearch, rank) "
+        "VALUES ('rank', 'bm25(0.0, 10.0, 1.0, 2.0, 4.0)')",
+        'DELETE FROM ProductSearch',
+        'INSERT INTO ProductSearch '
+        '(rowid, product_id, name, description, colors, category) '
+        'SELECT CAST(product_id AS INTEGER), product_id, name, description, '
+        'colors, category FROM Products',
+        'CREATE TRIGGER IF NOT EXISTS products_search_insert '
+        'AFTER INSERT ON Products BEGIN '
+        'INSERT INTO ProductSearch '
+        '(rowid, product_id, name, description, colors, category) '
+        'VALUES (CAST(new.product_id AS INTEGER), new.product_id, new.name, '
+        'new.description, new.colors, new.category); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS products_search_update '
+        'AFTER UPDATE OF name, description, colors, category ON Products '
+        'BEGIN '
+        'UPDATE ProductSearch SET name = new.name, '
+        'description = new.description, colors = new.colors, '
+        'category = new.category '
+        'WHERE rowid = CAST(old.product_id AS INTEGER); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS products_search_delete '
+        'AFTER DELETE ON Products BEGIN '
+        'DELETE FROM ProductSearch '
+        'WHERE rowid = CAST(old.product_id AS INTEGER); '
+        'END',
+    ]),
+    # Databases that already have it got it from database.configure_engine()
+    (7, 'Adds table that keeps the last ID handed out for each table', [
+        'CREATE TABLE IF NOT EXISTS Sequences ('
+        'name TEXT PRIMARY KEY, '
+        'value INTEGER NOT NULL)',
+    ]),
+]
+
+def _create_version_table(connection) -> None:
+    """Creates table that records applied migrations if it does not exist."""
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS SchemaVersions ('
+        'version INTEGER PRIMARY KEY, '
+        'description TEXT, '
+        'applied_at TEXT)'
+    ))
+
+def current_version() -> int:
+    """Returns the version of the latest migration applied to the database
+    or 0 if none has been applied."""
+    with db.get_engine().begin() as connection:
+        _create_version_table(connection)
+        version = connection.execute(
+            text('SELECT MAX(version) FROM SchemaVersions')
+        ).scalar()
+    return version or 0
+
+def upgrade(target: int | None = None) -> int:
+    """Applies, in order, every migration newer than the database's current
+    version.
+
+    A migration's version is only recorded once all of its statements have
+    run, so a failed migration is attempted again on the next startup.
+
+    Parameters:
+    target (int): Version to stop at. All migrations are applied if not
+    given.
+
+    Returns:
+    int: Version of the database after upgrading.
+    """
+    version = current_version()
+    for number, description, statements in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with db.get_engine().begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(
+                text('INSERT INTO SchemaVersions '
+                     '(version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'),
+                {
+                    'version': number,
+                    'description': description,
+                    'applied_at': datetime.now().isoformat(timespec='seconds'),
+                },
+            )
+        version = number
+    return version
@@ -2,17 +2,24 @@ from __future__ import annotations
 
 from datetime import date
 from enum import Enum
+from bisect import bisect_right
+from collections import OrderedDict
 from typing import Any, cast
-import base64
-import os
+import inspect
+import json
+import re
+import threading
+import time
 
 import justpy as jp
-from sqlalchemy import Column, Float, ForeignKey, Integer, Text
+from sqlalchemy import (Column, Float, ForeignKey, Index, Integer, Text, and_,
+                        delete, func, select, text, update)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import relationship, selectinload
 
 import database as db
-import file_handling as file
+import media
+import shipping
 
 Base = declarative_base()
 metadata = Base.metadata
@@ -28,6 +35,11 @@ class Category(Enum):
 
 class Product(Base):
     __tablename__ = 'Products'
+    # Indexes are created through the migrations module
+    __table_args__ = (
+        Index('ix_products_category_available_units',
+              'category', 'available_units'),
+    )
 
     product_id = Column(Text, primary_key=True)
     name = Column(Text)
@@ -42,10 +54,8 @@ class Product(Base):
     def __init__(self, *, product_id: str = None, name: str, price: float,
                  category: str, description: str, images: str = 'Por añadir', 
                  colors: str, sizes: str, available_units: int) -> None:
-        if product_id != None:
-            self.product_id = product_id
-        else:
-            self.product_id = db.get_new_id(Product.product_id)
+        # New products get their ID when they are added to the database
+        self.product_id = product_id
         self.name = name
         self.price = price
         self.category = category
@@ -58,60 +68,307 @@ class Product(Base):
     def delete_product(self) -> None:
         """Deletes a product from database."""
         
-        # Removes associated images from static folder
-        for img in self.images.split('-'):
-            os.remove(f'media/{img}')
-        # Removes from database
-        db.delete_from_db(Product, self.product_id)
+        with db.session_scope():
+            # Releases associated images; images shared with other products
+            # are kept
+            unused_images = [img for img in self.images.split('-')
+                             if media.release(img)]
+            # Removes from database
+            db.delete_from_db(Product, self.product_id)
+        # Unused images are removed by the media collector once the product
+        # is gone
+        media.collector.queue(unused_images)
+        catalogue.remove(self.product_id)
         
     def update_product(self) -> None:
         """Modifies a product's information in the database."""
         
-        session = db.get_session()
-        db_object = session.get(Product, self.product_id)
-        db_object.name = self.name
-        db_object.price = self.price
-        db_object.category = self.category
-        db_object.description = self.description
-        db_object.colors = self.colors
-        db_object.sizes = self.sizes
-        db_object.available_units = self.available_units
-        session.commit()
-    
-    def add_product(self, file_input) -> None:
+        with db.session_scope() as session:
+            db_object = session.get(Product, self.product_id)
+            db_object.name = self.name
+            db_object.price = self.price
+            db_object.category = self.category
+            db_object.description = self.description
+            db_object.colors = self.colors
+            db_object.sizes = self.sizes
+            db_object.available_units = self.available_units
+        catalogue.patch(db_object)
+    
+    def add_product(self, uploads: list[str]) -> None:
         """Adds product to database.
         
         Parameters:
-        file_input: Element containing images.
+        uploads (list): Names of the product's images, as returned by
+        media.receive_upload().
         """
         if db.row_count(Product) > 1000:
             # Limit of products in database has been reached
             raise Exception('Límite de productos alcanzado.')
         else:
-            # Uploads images to static folder and links product to them
-            self.upload_images(file_input)
-            # Adds product to database
-            db.add_to_db(self)
+            with db.session_scope():
+                # Gets ID in the same transaction the product is added in
+                self.product_id = db.get_new_id(Product.product_id)
+                # Uploads images to static folder and links product to them
+                self.upload_images(uploads)
+                # Adds product to database
+                db.add_to_db(self)
+            catalogue.patch(self)
     
-    def upload_images(self, file_input) -> None:
-        """Uploads a product's images to the static folder and links
+    def upload_images(self, uploads: list[str]) -> None:
+        """Moves a product's uploaded images to the static folder and links
         product to them.
         
         Parameters:
-        file_input: Element containing images.
+        uploads (list): Names of the uploaded images, as returned by
+        media.receive_upload().
+        """
+        if not uploads:
+            raise Exception('Debe subir al menos una imagen.')
+        # Images are named after a hash of their content, so that identical
+        # images are stored once and can be cached forever
+        pic_names = [media.store_upload(name) for name in uploads]
+        self.images = '-'.join(pic_names)
+        # Resized copies are made in the background
+        media.schedule_derivatives(self.images.split('-'))
+
+    def search(query: str, *, offset: int = 0, limit: int = 20,
+               available_only: bool = False
+               ) -> tuple[list[Product], int | None]:
+        """Returns a page of the products whose name, description, colors
+        or category contain every word of a search, best matches first,
+        alongside the offset of the next page, which is None if there is
+        none.
+        
+        Words match regardless of case and accents, and also match longer
+        words they are the start of. Matches are ranked with BM25 over the
+        ProductSearch index, where a match in the name weighs the most.
+        
+        Parameters:
+        query (str): Words to search for, as typed by the user.
+        offset (int): Offset returned with the previous page.
+        limit (int): Maximum number of products in the page.
+        available_only (bool): Whether products without available units
+        are left out.
+        """
+        # Only words are kept, so that no input is read as FTS5 syntax
+        words = re.findall(r'\w+', query)[:10]
+        if not words:
+            return [], None
+        match = ' '.join([f'"{word}"*' for word in words])
+        statement = text(
+            'SELECT Products.* FROM ProductSearch '
+            'JOIN Products ON Products.product_id = ProductSearch.product_id '
+            'WHERE ProductSearch MATCH :match '
+            + ('AND Products.available_units > 0 ' if available_only else '')
+            + 'ORDER BY ProductSearch.rank LIMIT :limit OFFSET :offset'
+        )
+        with db.session_scope() as session:
+            products = session.execute(
+                select(Product).from_statement(statement),
+                # One more product tells whether there is a next page
+                {'match': match, 'limit': limit+1, 'offset': offset},
+            ).scalars().all()
+        if len(products) > limit:
+            return products[:limit], offset+limit
+        return products, None
+
+
+class CategoryIndex():
+    """Products and their IDs ordered by ID, by category; None stands for
+    all categories.
+    
+    An index is never modified once built, so it can be read without a
+    lock while a new one is built to replace it.
+    """
+    __slots__ = ('products', 'ids')
+    
+    def __init__(self, products: dict[str | None, tuple[Product, ...]]) -> None:
+        self.products = products
+        self.ids = {
+            category: tuple(product.product_id for product in products)
+            for category, products in products.items()
+        }
+
+
+class Catalogue():
+    """Process-wide snapshot of the products in the database.
+    
+    Products are kept by ID and in per-category lists ordered by ID. The
+    snapshot is loaded on first use and patched whenever this process adds,
+    modifies or deletes a product; every change increases its version.
+    """
+    
+    def __init__(self) -> None:
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+        self._by_id: dict[str, Product] = {}
+        # Replaced as a whole, never modified
+        self._index = CategoryIndex({})
+        self._lock = threading.Lock()
+    
+    @property
+    def metrics(self) -> dict[str, int]:
+        """Returns version, number of products and counters of lookups
+        served from the snapshot (hits) and from the database (misses)."""
+        
+        return {'version': self.version, 'products': len(self._by_id),
+                'hits': self.hits, 'misses': self.misses}
+    
+    def load(self) -> None:
+        """Replaces the snapshot with every product in the database."""
+        
+        products = db.get_table_objects(Product)
+        with self._lock:
+            self._by_id = {product.product_id: product for product in products}
+            self._loaded = True
+            self._reindex()
+    
+    def get(self, product_id: str) -> Product | None:
+        """Returns a product or None if it does not exist.
+        
+        Parameters:
+        product_id (str): ID of the product.
+        """
+        
+        if not self._loaded:
+            self.load()
+        product = self._by_id.get(product_id)
+        if product is not None:
+            self.hits += 1
+        else:
+            # Product might have been added by another process
+            self.misses += 1
+            product = db.get_from_db(Product, product_id)
+            if product is not None:
+                self.patch(product)
+        return product
+    
+    def get_many(self, product_ids) -> dict[str, Product]:
+        """Returns the existing products among the given IDs, by ID.
+        
+        Parameters:
+        product_ids: IDs of the products.
+        """
+        
+        if not self._loaded:
+            self.load()
+        products = {}
+        misses = []
+        for product_id in product_ids:
+            if (product:=self._by_id.get(product_id)) is not None:
+                products[product_id] = product
+            else:
+                misses.append(product_id)
+        self.hits += len(products)
+        if not misses:
+            return products
+        # Products might have been added by another process; all of them
+        # are read with one query
+        self.misses += len(misses)
+        loaded = db.get_table_objects(Product,
+                                      Product.product_id.in_(misses))
+        if loaded:
+            with self._lock:
+                for product in loaded:
+                    self._by_id[product.product_id] = product
+                self._reindex()
+        products.update((product.product_id, product) for product in loaded)
+        return products
+    
+    def page(self, category: str | None = None, after: str | None = None,
+             limit: int = 20) -> tuple[list[Product], str | None]:
+        """Returns a page of available products ordered by ID, alongside
+        the cursor for the next page, which is None if there is none.
+        
+        Parameters:
+        category (str): Category of the products. All categories are
+        included if not given.
+        after (str): Cursor returned with the previous page.
+        limit (int): Maximum number of products in the page.
+        """
+        
+        if not self._loaded:
+            self.load()
+        self.hits += 1
+        # Products and IDs come from the same index even if it is replaced
+        index = self._index
+        products = index.products.get(category, ())
+        ids = index.ids.get(category, ())
+        start = bisect_right(ids, after) if after is not None else 0
+        page = []
+        for product in products[start:]:
+            if product.available_units > 0:
+                if len(page) == limit:
+                    return page, page[-1].product_id
+                page.append(product)
+        return page, None
+    
+    def patch(self, product: Product) -> None:
+        """Adds a product to the snapshot or replaces its previous version.
+        
+        Parameters:
+        product (Product): Product as stored in the database.
+        """
+        
+        if not self._loaded:
+            return
+        with self._lock:
+            self._by_id[product.product_id] = product
+            self._reindex()
+    
+    def refresh(self, product_ids) -> None:
+        """Reloads the given products from the database.
+        
+        Parameters:
+        product_ids: IDs of the products to reload.
+        """
+        
+        if not self._loaded:
+            return
+        products = db.get_table_objects(
+            Product,
+            Product.product_id.in_(list(product_ids)),
+        )
+        with self._lock:
+            for product in products:
+                self._by_id[product.product_id] = product
+            self._reindex()
+    
+    def remove(self, product_id: str) -> None:
+        """Removes a product from the snapshot.
+        
+        Parameters:
+        product_id (str): ID of the product.
         """
         
-        # Writes the content to a file after decoding the base64 content
-        pic_names = ''
-        for i, v in enumerate(file_input.files):
-            with open(f'media/{self.product_id}_{i}_{v.name}', 'wb') as file_input:
-                pic_names += f'{self.product_id}_{i}_{v.name}-'
-                file_input.write(base64.b64decode(v.file_content))     
-        pic_names = pic_names[:-1]
-        self.images = pic_names
+        with self._lock:
+            if self._by_id.pop(product_id, None) is not None:
+                self._reindex()
+    
+    def _reindex(self) -> None:
+        """Rebuilds the per-category lists and increases the version."""
+        
+        by_category = {None: []}
+        for product in sorted(self._by_id.values(),
+                              key=lambda product: product.product_id):
+            by_category[None].append(product)
+            by_category.setdefault(product.category, []).append(product)
+        self._index = CategoryIndex({
+            category: tuple(products)
+            for category, products in by_category.items()
+        })
+        self.version += 1
+
+
+catalogue = Catalogue()
 
 
 class Item():
+    # Lets subclasses that are not database tables avoid a __dict__
+    __slots__ = ()
+    
     def __init__(self, product_id: str, quantity: int,
                  color: str, size: str) -> None:
         self.product_id = product_id
@@ -124,7 +381,7 @@ class Item():
         """Returns the item's corresponding product or None if the product 
         is not found in the database."""
         
-        return db.get_from_db(Product, self.product_id)
+        return catalogue.get(self.product_id)
 
 
 class OrderStatus(Enum):
@@ -136,6 +393,9 @@ class OrderStatus(Enum):
 
 class Order(Base):
     __tablename__ = 'Orders'
+    __table_args__ = (
+        Index('ix_orders_status_date', 'status', 'date'),
+    )
 
     order_id = Column(Text, primary_key=True)
     total = Column(Float)
@@ -148,13 +408,17 @@ class Order(Base):
     ship_zipcode = Column(Text)
     date = Column(Text)
     status = Column(Text)
+
+    orderitems = relationship('OrderItem', back_populates='order',
+                              cascade='all,delete')
     
     def __init__(self, order_id: str, cart_total: float, buyer_name: str,
                  buyer_email: str, buyer_phone: str, ship_city: str,
                  ship_department: str, ship_address: str,
                  ship_zipcode: str) -> None:
         self.order_id = order_id
-        self.total = cart_total + Order.get_delivery_fee(ship_city)
+        self.total = cart_total + Order.get_delivery_fee(ship_city,
+                                                         ship_department)
         self.buyer_phone = buyer_phone
         self.buyer_name = buyer_name
         self.buyer_email = buyer_email
@@ -173,31 +437,135 @@ class Order(Base):
         new_status (str): New status to assign to the order.
         """
         
-        session = db.get_session()
-        db_object = session.get(Order, self.order_id)
-        if new_status == OrderStatus.DELIVERED:
-            session.delete(db_object)
-        else:
-            db_object.status = new_status.value
-        session.commit()
+        Order.update_statuses(new_status, order_ids=[self.order_id])
+        self.status = new_status.value
+
+    def update_statuses(new_status: OrderStatus, *,
+                        order_ids: list[str] | None = None,
+                        status: str | None = None,
+                        date_from: str | None = None,
+                        date_to: str | None = None) -> list[str]:
+        """Modifies the status of every order with the given IDs and that
+        matches the given filters, or deletes them alongside their items if
+        their new status is DELIVERED, in a single transaction.
+        
+        Parameters:
+        new_status (OrderStatus): New status to assign to the orders.
+        order_ids (list): IDs of the orders to modify. Every order that
+        matches the filters is modified if not given.
+        status, date_from, date_to: Filters, as in get_page(). At least one
+        is required if order_ids is not given.
+
+        Returns:
+        list: IDs of the orders that were modified or deleted.
+        """
+        if order_ids is None and not (status or date_from or date_to):
+            raise Exception('Debe indicar las órdenes o al menos un filtro.')
+        matched = Order.filter_condition(status, date_from, date_to)
+        if order_ids is not None:
+            matched = and_(matched, Order.order_id.in_(order_ids))
+        with db.session_scope() as session:
+            order_ids = session.execute(
+                select(Order.order_id).where(matched)
+            ).scalars().all()
+            if len(order_ids) == 0:
+                return []
+            # The filters are checked again by the write, so orders changed
+            # since they were selected are left as they are
+            matched = and_(matched, Order.order_id.in_(order_ids))
+            if new_status == OrderStatus.DELIVERED:
+                session.execute(
+                    delete(OrderItem)
+                    .where(OrderItem.order_id.in_(
+                        select(Order.order_id).where(matched)))
+                    .execution_options(synchronize_session=False)
+                )
+                session.execute(
+                    delete(Order).where(matched)
+                    .execution_options(synchronize_session=False)
+                )
+                # The write lock is held from the first write on, so these
+                # are exactly the orders that were not deleted
+                remaining = set(session.execute(
+                    select(Order.order_id)
+                    .where(Order.order_id.in_(order_ids))
+                ).scalars())
+                return [order_id for order_id in order_ids
+                        if order_id not in remaining]
+            session.execute(
+                update(Order).where(matched)
+                .values(status=new_status.value)
+                .execution_options(synchronize_session=False)
+            )
+            return session.execute(
+                select(Order.order_id)
+                .where(Order.order_id.in_(order_ids),
+                       Order.status == new_status.value)
+            ).scalars().all()
     
-    def get_delivery_fee(ship_city: str) -> float:
+    def get_delivery_fee(ship_city: str,
+                         ship_department: str | None = None) -> float:
         """Returns delivery fee of an order based on the city it ships to.
         
         Parameters:
         ship_city (str): City that the fee should be calculated for.
+        ship_department (str): Department the city belongs to.
         """
-        ship_city = ship_city.strip().title()
-        delivery_fee = file.get_content_by_field('costo_envios.txt',
-                                                 ship_city)
-        if delivery_fee is None:
-            delivery_fee = file.get_content_by_field('costo_envios.txt',
-                                                     'Resto de ciudades y municipios')
-        return float(delivery_fee)
+        return shipping.rates.get_fee(ship_city, ship_department)
+
+    def with_items() -> list:
+        """Returns loader options that load the items of orders, and the
+        products of those items, with one query each for all the orders
+        fetched at once."""
+        return [selectinload(Order.orderitems).selectinload(OrderItem.product)]
+
+    def get_page(*, status: str | None = None, date_from: str | None = None,
+                 date_to: str | None = None, after: str | None = None,
+                 limit: int = 20) -> tuple[list[Order], str | None]:
+        """Returns a page of orders, from newest to oldest, with their items
+        and products loaded, alongside the cursor of the next page.
+        
+        Parameters:
+        status (str): Only orders with this status are returned if given.
+        date_from (str): Only orders created on or after this date
+        (YYYY-MM-DD) are returned if given.
+        date_to (str): Only orders created on or before this date
+        (YYYY-MM-DD) are returned if given.
+        after (str): Cursor returned with the previous page.
+        limit (int): Maximum number of orders in the page.
+        """
+        return db.get_page(
+            Order,
+            Order.order_id,
+            after=after,
+            limit=limit,
+            condition=Order.filter_condition(status, date_from, date_to),
+            descending=True,
+            options=Order.with_items(),
+        )
+
+    def filter_condition(status: str | None = None,
+                         date_from: str | None = None,
+                         date_to: str | None = None):
+        """Returns condition that orders with the given status and created
+        within the given dates (YYYY-MM-DD) match. Filters that are not
+        given are not applied."""
+        conditions = []
+        if status:
+            conditions.append(Order.status == status)
+        if date_from:
+            conditions.append(Order.date >= date_from)
+        if date_to:
+            conditions.append(Order.date <= date_to)
+        return and_(True, *conditions)
 
 
 class OrderItem(Base, Item):
     __tablename__ = 'OrderItems'
+    __table_args__ = (
+        Index('ix_orderitems_order_id', 'order_id'),
+        Index('ix_orderitems_product_id', 'product_id'),
+    )
 
     order_id = Column(ForeignKey('Orders.order_id'))#, ondelete='CASCADE'))
     product_id = Column(ForeignKey('Products.product_id'))
@@ -206,7 +574,7 @@ class OrderItem(Base, Item):
     size = Column(Text)
 
     product = relationship('Product')
-    order = relationship('Order', backref=backref('orderitems', cascade='all,delete'))
+    order = relationship('Order', back_populates='orderitems')
     
     __mapper_args__ = {
         'primary_key':[order_id, product_id, quantity, color, size]
@@ -219,6 +587,14 @@ class OrderItem(Base, Item):
 
 
 class CartItem(Item):
+    __slots__ = ('product_id', 'quantity', 'color', 'size')
+    
+    @property
+    def key(self) -> tuple[str, str, str]:
+        """Returns the attributes that identify the item in a cart."""
+        
+        return (self.product_id, self.color, self.size)
+    
     @property
     def item_total(self) -> float:
         """Returns item total."""
@@ -235,9 +611,7 @@ class CartItem(Item):
         """
         
         other = cast(CartItem, other)
-        return all([self.product_id==other.product_id,
-                    self.color==other.color,
-                    self.size==other.size])
+        return self.key == other.key
         
     def change_quantity(self, amount: int) -> None:
         """Changes item quantity by given amount.
@@ -252,19 +626,83 @@ class CartItem(Item):
         else:
             raise Exception('No hay suficientes unidades disponibles.')
 
+
+class StockReservation(Base):
+    __tablename__ = 'StockReservations'
+    __table_args__ = (
+        Index('ix_stockreservations_product_id', 'product_id', 'expires_at'),
+    )
+
+    session_id = Column(Text, primary_key=True)
+    product_id = Column(ForeignKey('Products.product_id'), primary_key=True)
+    quantity = Column(Integer)
+    expires_at = Column(Float)
+
+    def reserved_units(product_id: str, excluded_session_id: str | None,
+                       now: float):
+        """Returns subquery that sums the units of a product held by active
+        reservations of sessions other than the excluded one.
+
+        Parameters:
+        product_id (str): ID of the product.
+        excluded_session_id (str): Session whose reservation is not counted.
+        now (float): Current time, as returned by time.time().
+        """
+        return (
+            select(func.coalesce(func.sum(StockReservation.quantity), 0))
+            .where(StockReservation.product_id==product_id,
+                   StockReservation.session_id!=(excluded_session_id or ''),
+                   StockReservation.expires_at>now)
+            .scalar_subquery()
+        )
+
+
+class CartLine():
+    """Cart item alongside its related product and total, as loaded in a
+    single pricing of the cart."""
+    
+    def __init__(self, item: CartItem, product: Product | None) -> None:
+        self.item = item
+        self.product = product
+        if product is not None:
+            self.total = product.price*item.quantity
+        else:
+            self.total = 0
+
      
 class Cart():
-    def __init__(self) -> None:
-        self.cart_items = []
+    def __init__(self, *, reservation_id: str = None,
+                 reservation_ttl: float = 15*60) -> None:
+        # Items in the order they were added, by product ID, color and size
+        self.cart_items: dict[tuple[str, str, str], CartItem] = {}
+        # If given, units of the products in the cart are held for the cart
+        # under this ID for reservation_ttl seconds after each change
+        self.reservation_id = reservation_id
+        self.reservation_ttl = reservation_ttl
     
     @property
     def cart_total(self) -> float:
         """Returns cart total."""
         
-        if len(self.cart_items) > 0:
-            return sum([item.item_total for item in self.cart_items])
-        else:
-            return 0
+        return self.price_items()[1]
+    
+    def price_items(self) -> tuple[list[CartLine], float]:
+        """Returns the lines of the cart and its subtotal.
+        
+        All the products referenced by the cart are read from the catalogue
+        at once, so that every line total and the subtotal come from the
+        same snapshot.
+        Lines whose product no longer exists have a total of zero.
+        """
+        
+        if len(self.cart_items) == 0:
+            return [], 0
+        products = catalogue.get_many(
+            {item.product_id for item in self.cart_items.values()}
+        )
+        lines = [CartLine(item, products.get(item.product_id))
+                 for item in self.cart_items.values()]
+        return lines, sum([line.total for line in lines])
  
     def add_item(self, product_id: str, quantity: int, 
                  color: str, size: str) -> None:
@@ -285,20 +723,20 @@ class Cart():
         new_item = CartItem(product_id, quantity, color, size)
         if quantity > 0:
             # Checks if item already exists in cart to add its new quantity
-            # to the quantity of the existing item or else append new item to
+            # to the quantity of the existing item or else add new item to
             # cart items
-            for item_in_cart in self.cart_items:
-                if new_item == item_in_cart:
-                    try:
-                        item_in_cart.change_quantity(new_item.quantity)
-                        break
-                    except:
-                        raise Exception('No hay suficientes unidades '\
-                                        'disponibles.')
+            item_in_cart = self.cart_items.get(new_item.key)
+            if item_in_cart is not None:
+                self.change_quantity(item_in_cart, new_item.quantity)
             else:
                 # Checks if there are enough available units
                 if new_item.related_product.available_units > new_item.quantity:
-                    self.cart_items.append(new_item)
+                    self.cart_items[new_item.key] = new_item
+                    try:
+                        self._reserve(product_id)
+                    except:
+                        del self.cart_items[new_item.key]
+                        raise
                 else:
                     raise Exception('No hay suficientes unidades '\
                                     'disponibles.')
@@ -310,47 +748,599 @@ class Cart():
         item (CartItem): Cart item to remove.
         """
         
-        self.cart_items.remove(item)
+        if self.cart_items.pop(item.key, None) is not None:
+            self._reserve(item.product_id, check=False)
+    
+    def change_quantity(self, item: CartItem, amount: int) -> None:
+        """Changes quantity of the cart's item with the same product ID,
+        color and size as the given item.
+        
+        Parameters:
+        item (CartItem): Cart item to modify.
+        amount (int): Number to add to item quantity.
+        """
+        
+        if (item_in_cart:=self.cart_items.get(item.key)) is not None:
+            previous_quantity = item_in_cart.quantity
+            item_in_cart.change_quantity(amount)
+            try:
+                self._reserve(item.product_id, check=amount>0)
+            except:
+                item_in_cart.quantity = previous_quantity
+                raise
+    
+    def _reserve(self, product_id: str, check: bool = True) -> None:
+        """Holds the units of a product that are in the cart, renewing the
+        reservation's expiry, if the cart uses reservations.
+        
+        Raises an exception if there are not enough units left once the
+        active reservations of other carts are discounted. The check is
+        advisory; checkout verifies stock again atomically.
+        
+        Parameters:
+        product_id (str): ID of the product to reserve.
+        check (bool): Whether to check availability, which is not needed
+        when the reserved quantity decreases.
+        """
+        
+        if self.reservation_id is None:
+            return
+        quantity = sum([item.quantity for item in self.cart_items.values()
+                        if item.product_id==product_id])
+        now = time.time()
+        with db.session_scope() as session:
+            # Discards the product's expired reservations
+            session.query(StockReservation).filter(
+                StockReservation.product_id==product_id,
+                StockReservation.expires_at<=now,
+            ).delete(synchronize_session=False)
+            if quantity == 0:
+                session.query(StockReservation).filter(
+                    StockReservation.session_id==self.reservation_id,
+                    StockReservation.product_id==product_id,
+                ).delete(synchronize_session=False)
+                return
+            available_units = session.execute(
+                select(Product.available_units
+                       - StockReservation.reserved_units(
+                           product_id, self.reservation_id, now))
+                .where(Product.product_id==product_id)
+            ).scalar()
+            if check and (available_units is None
+                          or available_units < quantity):
+                raise Exception('No hay suficientes unidades disponibles.')
+            session.merge(StockReservation(
+                session_id=self.reservation_id,
+                product_id=product_id,
+                quantity=quantity,
+                expires_at=now+self.reservation_ttl,
+            ))
     
-    def place_order(self, new_order_id: str, buyer_info: dict[str, str]) -> None:
-        """Creates a new order. 
+    def place_order(self, buyer_info: dict[str, str]) -> str:
+        """Creates a new order and returns its ID.
+        
+        The order is created in a single transaction that also takes the
+        ordered units out of each product's available units. If any product
+        does not have enough units left, discounting those held by other
+        carts' reservations, nothing is changed and an exception is raised.
         
         Parameters:
-        new_order_id (str): ID of order to be created.
         buyer_info (dict): Buyer information.
+        
+        Returns:
+        str: ID of the order created.
         """
         
         if db.row_count(Order) > 10**9:
             # Limit of orders in database has been reached
             raise Exception('Límite de órdenes alcanzado.')
         else:
-            # Creates order with given information and adds to database
-            new_order_id = new_order_id
-            new_order = Order(
-                order_id=new_order_id,
-                cart_total=self.cart_total,
-                buyer_name=buyer_info['name'],
-                buyer_email=buyer_info['email'],
-                buyer_phone=buyer_info['phone'],
-                ship_city=buyer_info['city'],
-                ship_department=buyer_info['department'],
-                ship_address=buyer_info['address'],
-                ship_zipcode=buyer_info['zipcode'],
-            )
-            for item in self.cart_items:
-                # Adds cart items to new order as orderitems
-                new_order_item = OrderItem(
+            with db.session_scope() as session:
+                # Gets ID in the same transaction the order is added in, so
+                # concurrent checkouts never share it
+                new_order_id = db.get_new_id(Order.order_id)
+                # Takes ordered units out of stock only if they are available
+                ordered_units = {}
+                for item in self.cart_items.values():
+                    ordered_units[item.product_id] = (
+                        ordered_units.get(item.product_id, 0) + item.quantity
+                    )
+                now = time.time()
+                for product_id, quantity in ordered_units.items():
+                    result = session.execute(
+                        update(Product)
+                        .where(Product.product_id==product_id,
+                               Product.available_units
+                               - StockReservation.reserved_units(
+                                   product_id, self.reservation_id, now)
+                               >= quantity)
+                        .values(available_units=Product.available_units
+                                                - quantity)
+                        .execution_options(synchronize_session=False)
+                    )
+                    if result.rowcount == 0:
+                        raise Exception('No hay suficientes unidades '\
+                                        'disponibles.')
+                if self.reservation_id is not None:
+                    # Releases the cart's reservations
+                    session.query(StockReservation).filter(
+                        StockReservation.session_id==self.reservation_id,
+                    ).delete(synchronize_session=False)
+                # Creates order with given information and adds to database
+                new_order = Order(
                     order_id=new_order_id,
-                    product_id=item.product_id,
-                    quantity=item.quantity,
-                    color=item.color,
-                    size=item.size,
+                    cart_total=self.cart_total,
+                    buyer_name=buyer_info['name'],
+                    buyer_email=buyer_info['email'],
+                    buyer_phone=buyer_info['phone'],
+                    ship_city=buyer_info['city'],
+                    ship_department=buyer_info['department'],
+                    ship_address=buyer_info['address'],
+                    ship_zipcode=buyer_info['zipcode'],
                 )
-                new_order.orderitems.append(new_order_item)
-            # Adds new order alongside its orderitems to database
-            db.add_to_db(new_order)
+                for item in self.cart_items.values():
+                    # Adds cart items to new order as orderitems
+                    new_order_item = OrderItem(
+                        order_id=new_order_id,
+                        product_id=item.product_id,
+                        quantity=item.quantity,
+                        color=item.color,
+                        size=item.size,
+                    )
+                    new_order.orderitems.append(new_order_item)
+                # Adds new order alongside its orderitems to database
+                db.add_to_db(new_order)
+            # Shows new available units in the catalogue
+            catalogue.refresh(ordered_units.keys())
             # Clears cart
             self.cart_items.clear()
+            return new_order_id
+
+
+class StoredCart(Base):
+    __tablename__ = 'Carts'
+
+    session_id = Column(Text, primary_key=True)
+    items = Column(Text)
+    last_access = Column(Float)
+
+
+class CartStore():
+    """Keeps one cart per visitor session.
+
+    At most max_carts carts are kept in memory; when a new one is needed the
+    least recently used cart is evicted. Carts that have not been used in
+    ttl seconds are discarded. If persist is True, carts are also saved to
+    the database, so that evicted carts can be restored and carts survive
+    restarts; sweep() deletes stored carts of visitors who never came back.
+    If reserve_stock is True, carts hold the units they contain for
+    reservation_ttl seconds after each change.
+    """
+
+    # Number of stored carts deleted per statement by sweep()
+    SWEEP_BATCH_SIZE = 500
+
+    def __init__(self, *, max_carts: int = 10000, ttl: float = 3*24*60*60,
+                 persist: bool = False, reserve_stock: bool = False,
+                 reservation_ttl: float = 15*60) -> None:
+        self.max_carts = max_carts
+        self.ttl = ttl
+        self.persist = persist
+        self.reserve_stock = reserve_stock
+        self.reservation_ttl = reservation_ttl
+        # Carts ordered from least to most recently used, as
+        # session_id: (cart, last access time)
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._counters = {'created': 0, 'restored': 0,
+                          'evicted_lru': 0, 'evicted_ttl': 0,
+                          'swept': 0}
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        """Returns number of live carts alongside counters of created,
+        restored and evicted carts."""
+
+        with self._lock:
+            return {'live': len(self._carts), **self._counters}
+
+    def get(self, session_id: str) -> Cart:
+        """Returns the cart of a session, restoring it from the database or
+        creating it if it is not in memory.
+
+        Parameters:
+        session_id (str): ID of the visitor's session.
+        """
+
+        now = time.time()
+        # The database is only accessed outside the lock, so that waiting
+        # for it does not hold up the carts of other sessions
+        with self._lock:
+            expired = self._evict_expired(now)
+            cart = self._touch(session_id, now)
+        self._delete_stored(expired)
+        if cart is not None:
+            return cart
+        restored = self._restore(session_id, now)
+        with self._lock:
+            # Another call may have added the cart in the meantime
+            cart = self._touch(session_id, now)
+            if cart is not None:
+                return cart
+            if restored is not None:
+                cart = restored
+                self._counters['restored'] += 1
+            else:
+                cart = self._new_cart(session_id)
+                self._counters['created'] += 1
+            while len(self._carts) >= self.max_carts:
+                self._carts.popitem(last=False)
+                self._counters['evicted_lru'] += 1
+            self._carts[session_id] = (cart, now)
+        return cart
+
+    def save(self, session_id: str) -> None:
+        """Stores the current items of a session's cart in the database if
+        the store is persistent.
+
+        Parameters:
+        session_id (str): ID of the visitor's session.
+        """
+
+        if not self.persist:
+            return
+        with self._lock:
+            if session_id not in self._carts:
+                return
+            cart, last_access = self._carts[session_id]
+            items = json.dumps([[item.product_id, item.quantity,
+                                 item.color, item.size]
+                                for item in cart.cart_items.values()])
+        with db.session_scope() as session:
+            session.merge(StoredCart(session_id=session_id, items=items,
+                                     last_access=last_access))
+
+    def sweep(self) -> None:
+        """Discards expired carts from memory and, if the store is
+        persistent, deletes stored carts that were not saved in ttl seconds.
+
+        Stored carts whose session still has a cart in memory are kept,
+        since the cart in memory is the current one and is saved again on
+        its next change.
+        """
+
+        now = time.time()
+        with self._lock:
+            expired = self._evict_expired(now)
+            live = set(self._carts)
+        self._delete_stored(expired)
+        if not self.persist:
+            return
+        with db.session_scope() as session:
+            stale = [session_id for session_id in session.execute(
+                         select(StoredCart.session_id)
+                         .where(StoredCart.last_access < now-self.ttl)
+                     ).scalars()
+                     if session_id not in live]
+            for start in range(0, len(stale), self.SWEEP_BATCH_SIZE):
+                session.execute(
+                    delete(StoredCart)
+                    .where(StoredCart.session_id.in_(
+                        stale[start:start+self.SWEEP_BATCH_SIZE]))
+                    .execution_options(synchronize_session=False)
+                )
+        with self._lock:
+            self._counters['swept'] += len(stale)
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        """Starts a background thread that calls sweep() every interval
+        seconds.
+
+        Parameters:
+        interval (float): Seconds between sweeps.
+        """
+
+        if self._sweeper is not None:
+            return
+        def sweep_periodically() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except:
+                    # Tries again on the next sweep
+                    pass
+        self._sweeper = threading.Thread(target=sweep_periodically,
+                                         name='cart-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def _new_cart(self, session_id: str) -> Cart:
+        """Returns an empty cart for a session."""
+
+        if self.reserve_stock:
+            return Cart(reservation_id=session_id,
+                        reservation_ttl=self.reservation_ttl)
+        return Cart()
+
+    def _restore(self, session_id: str, now: float) -> Cart | None:
+        """Returns the cart stored in the database for a session or None if
+        there is none or it has expired."""
+
+        if not self.persist:
+            return None
+        with db.session_scope() as session:
+            stored_cart = session.get(StoredCart, session_id)
+            if stored_cart is None:
+                return None
+            if now-stored_cart.last_access > self.ttl:
+                session.delete(stored_cart)
+                return None
+            cart = self._new_cart(session_id)
+            for product_id, quantity, color, size in json.loads(stored_cart.items):
+                item = CartItem(product_id, quantity, color, size)
+                cart.cart_items[item.key] = item
+        return cart
+
+    def _touch(self, session_id: str, now: float) -> Cart | None:
+        """Marks the cart of a session as the most recently used one and
+        returns it, or returns None if it is not in memory. Must be called
+        with the lock held."""
+
+        if session_id not in self._carts:
+            return None
+        cart = self._carts.pop(session_id)[0]
+        self._carts[session_id] = (cart, now)
+        return cart
+
+    def _evict_expired(self, now: float) -> list[str]:
+        """Discards carts that have not been used in ttl seconds and
+        returns the IDs of their sessions. Must be called with the lock
+        held.
+
+        Since carts are ordered by last use, only the oldest ones need to be
+        checked.
+        """
+
+        expired = []
+        while self._carts:
+            session_id, (cart, last_access) = next(iter(self._carts.items()))
+            if now-last_access <= self.ttl:
+                break
+            self._carts.popitem(last=False)
+            self._counters['evicted_ttl'] += 1
+            expired.append(session_id)
+        return expired
+
+    def _delete_stored(self, session_ids: list[str]) -> None:
+        """Deletes the stored carts of the given sessions if the store is
+        persistent."""
+
+        if not session_ids or not self.persist:
+            return
+        with db.session_scope() as session:
+            session.query(StoredCart).filter(
+                StoredCart.session_id.in_(session_ids)
+            ).delete(synchronize_session=False)
+
+
+class StoredAdminSession(Base):
+    __tablename__ = 'AdminSessions'
+
+    session_id = Column(Text, primary_key=True)
+    created_at = Column(Float)
+    last_access = Column(Float)
+
+
+class AdminSessionStore():
+    """Keeps the sessions in which the admin has logged in.
+
+    A session expires absolute_ttl seconds after login, or idle_ttl seconds
+    after it was last used, whichever comes first. At most max_sessions are
+    kept; logging in beyond that ends the least recently used session. If
+    persist is True, sessions are also stored in the database, so that they
+    survive restarts and are shared by every process using it.
+    """
+
+    # Seconds between writes of a session's last access to the database
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, *, max_sessions: int = 100,
+                 idle_ttl: float = 30*60, absolute_ttl: float = 8*60*60,
+                 persist: bool = False) -> None:
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.persist = persist
+        # Sessions ordered from least to most recently used, as
+        # session_id: [login time, last access time, last access stored]
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._counters = {'logins': 0, 'evicted_lru': 0, 'expired': 0}
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        """Returns number of live sessions alongside counters of logins and
+        of ended sessions."""
+
+        with self._lock:
+            return {'live': len(self._sessions), **self._counters}
+
+    def add(self, session_id: str) -> None:
+        """Starts an admin session.
+
+        Parameters:
+        session_id (str): ID of the session the admin logged in from.
+        """
+
+        now = time.time()
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            evicted = []
+            while len(self._sessions) >= self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+                self._counters['evicted_lru'] += 1
+            self._sessions[session_id] = [now, now, now]
+            self._counters['logins'] += 1
+        if self.persist:
+            with db.session_scope() as session:
+                session.merge(StoredAdminSession(session_id=session_id,
+                                                 created_at=now,
+                                                 last_access=now))
+                self._delete_stored(session, evicted)
+
+    def is_valid(self, session_id: str) -> bool:
+        """Returns True if the admin is logged in in a session and records
+        its use, or False if not.
+
+        Parameters:
+        session_id (str): ID of the session to check.
+        """
+
+        now = time.time()
+        valid, times = self._check(session_id, now)
+        if valid is not None:
+            return valid
+        return self._check_stored(session_id, times, now)
+
+    async def is_valid_async(self, session_id: str) -> bool:
+        """Same as is_valid, but the database is only accessed through
+        db.run_async, when the session is not in memory or its last access
+        is due to be stored. Other checks never leave the event loop.
+
+        Parameters:
+        session_id (str): ID of the session to check.
+        """
+
+        now = time.time()
+        valid, times = self._check(session_id, now)
+        if valid is not None:
+            return valid
+        return await db.run_async(self._check_stored, session_id, times,
+                                  now)
+
+    def _check(self, session_id: str,
+               now: float) -> tuple[bool | None, list[float] | None]:
+        """Checks a session against the sessions in memory and records its
+        use.
+
+        Returns:
+        tuple: Whether the session is valid, or None if the database must
+        be checked too, alongside its times if it is in memory.
+        """
+
+        with self._lock:
+            times = self._sessions.get(session_id)
+            if times is not None and not self._expired(times, now):
+                times[1] = now
+                self._sessions.move_to_end(session_id)
+                if not self.persist or now-times[2] < self.TOUCH_INTERVAL:
+                    return True, times
+                times[2] = now
+            elif not self.persist:
+                self._sessions.pop(session_id, None)
+                return False, None
+        return None, times
+
+    def _check_stored(self, session_id: str, times: list[float] | None,
+                      now: float) -> bool:
+        """Stores the last access of a session valid in memory, or checks a
+        session that is not against the database."""
+
+        with db.session_scope() as session:
+            if times is not None and not self._expired(times, now):
+                # Stores the last access so other processes see it
+                session.execute(
+                    update(StoredAdminSession)
+                    .where(StoredAdminSession.session_id == session_id)
+                    .values(last_access=now)
+                )
+                return True
+            # The session may have been started or used in another process
+            stored = session.get(StoredAdminSession, session_id)
+            if stored is not None:
+                times = [stored.created_at, stored.last_access,
+                         stored.last_access]
+                if self._expired(times, now):
+                    session.delete(stored)
+                    stored = None
+        with self._lock:
+            if stored is None:
+                self._sessions.pop(session_id, None)
+                return False
+            self._sessions[session_id] = times
+            self._sessions.move_to_end(session_id)
+        return True
+
+    def remove(self, session_id: str) -> None:
+        """Ends an admin session.
+
+        Parameters:
+        session_id (str): ID of the session to end.
+        """
+
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.persist:
+            with db.session_scope() as session:
+                self._delete_stored(session, [session_id])
+
+    def sweep(self) -> None:
+        """Ends every expired session."""
+
+        now = time.time()
+        with self._lock:
+            expired = [session_id
+                       for session_id, times in self._sessions.items()
+                       if self._expired(times, now)]
+            for session_id in expired:
+                del self._sessions[session_id]
+            self._counters['expired'] += len(expired)
+        if self.persist:
+            with db.session_scope() as session:
+                session.query(StoredAdminSession).filter(
+                    (StoredAdminSession.created_at < now-self.absolute_ttl)
+                    | (StoredAdminSession.last_access < now-self.idle_ttl)
+                ).delete(synchronize_session=False)
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        """Starts a background thread that calls sweep() every interval
+        seconds.
+
+        Parameters:
+        interval (float): Seconds between sweeps.
+        """
+
+        if self._sweeper is not None:
+            return
+        def sweep_periodically() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except:
+                    # Tries again on the next sweep
+                    pass
+        self._sweeper = threading.Thread(target=sweep_periodically,
+                                         name='admin-session-sweeper',
+                                         daemon=True)
+        self._sweeper.start()
+
+    def _expired(self, times: list[float], now: float) -> bool:
+        """Returns True if a session with the given login and last access
+        times has expired."""
+
+        return (now-times[0] > self.absolute_ttl
+                or now-times[1] > self.idle_ttl)
+
+    def _delete_stored(self, session, session_ids: list[str]) -> None:
+        """Deletes stored sessions from the database."""
+
+        if session_ids:
+            session.query(StoredAdminSession).filter(
+                StoredAdminSession.session_id.in_(session_ids)
+            ).delete(synchronize_session=False)
 
 
 class Section():
@@ -358,6 +1348,14 @@ class Section():
         self.name = name
         self.link = link
 
+    async def render(self, div: jp.Div) -> None:
+        """Adds the section's content to a div, awaiting link if it is a
+        coroutine function."""
+        if inspect.iscoroutinefunction(self.link):
+            await self.link(div)
+        else:
+            self.link(div)
+
 
 class TabsPills(jp.Div):
     """Modified version of class TabPills referenced in JustPy docs. 
@@ -373,7 +1371,7 @@ class TabsPills(jp.Div):
                     'font-family: \'Poppins\', sans-serif;'
 
     def __init__(self, **kwargs):
-        self.tabs = []  # list of {'id': id, 'label': label, 'content': content}
+        self.tabs = []  # list of {'id': id, 'label': label, 'content': content, 'builder': builder}
         self.value = None  # The value of the tabs component is the id of the selected tab
         self.content_height = 600
         self.last_rendered_value = None
@@ -400,8 +1398,11 @@ class TabsPills(jp.Div):
                 pass
         self.__dict__[key] = value
 
-    def add_tab(self, id, label, content) -> None:
-        self.tabs.append({'id': id, 'label': label, 'content': content})
+    def add_tab(self, id, label, content=None, builder=None) -> None:
+        """Adds a tab. If builder is given instead of content, it is called
+        to build the tab's content the first time the tab is selected."""
+        self.tabs.append({'id': id, 'label': label, 'content': content,
+                          'builder': builder})
         if not self.value:
             self.value = id
 
@@ -412,6 +1413,8 @@ class TabsPills(jp.Div):
         return None
 
     def set_content_div(self, tab):
+        if tab['content'] is None:
+            tab['content'] = tab['builder']()
         self.content_div.add(tab['content'])
         self.content_div.set_classes('overflow-auto relative overflow-hidden')
         self.content_div.style = f'height: {self.content_height}px;'
@@ -429,7 +1432,8 @@ class TabsPills(jp.Div):
 
         if self.delete_flag:
             for tab in self.tabs:
-                tab['content'].delete()
+                if tab['content'] is not None:
+                    tab['content'].delete()
                 tab['content'] = None
         super().delete()
 
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from typing import Iterable
+import threading
+import unicodedata
+
+import file_handling as file
+
+RATES_FILE = 'costo_envios.txt'
+# Field whose fee applies to cities without a rate of their own
+DEFAULT_FIELD = 'Resto de ciudades y municipios'
+
+def normalize(text: str) -> str:
+    """Returns text without accents, in lowercase and with single spaces,
+    so that different spellings of a place name are equal.
+
+    Parameters:
+    text (str): Name of a city or department.
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    without_accents = ''.join([c for c in decomposed
+                               if not unicodedata.combining(c)])
+    return ' '.join(without_accents.casefold().replace('.', ' ').split())
+
+def split_place(place: str) -> tuple[str, str | None]:
+    """Splits a place written as 'city' or 'city, department' into its
+    normalized city and department.
+
+    Parameters:
+    place (str): Place as written by a buyer or in the rates file.
+    """
+    city, _, department = place.partition(',')
+    return normalize(city), normalize(department) or None
+
+
+class ShippingRates():
+    """Delivery fees by city, and optionally department, read from a rates
+    file whose lines follow the form 'City;fee' or 'City, Department;fee'.
+
+    Rates are looked up in an index of normalized names that is built once
+    and rebuilt only when the file changes.
+    """
+
+    def __init__(self, filename: str = RATES_FILE) -> None:
+        self.filename = filename
+        self._content = None    # File content the index was built from
+        self._index: dict[tuple[str, str | None], float] = {}
+        self._default_fee = 0.0
+        self._lock = threading.Lock()
+
+    def get_fee(self, city: str, department: str | None = None) -> float:
+        """Returns delivery fee for a city.
+
+        The department may be given on its own or after a comma in the city.
+        A rate for the city and department is preferred over one for the
+        city alone, and the default rate is returned if there is neither.
+
+        Parameters:
+        city (str): City the order ships to.
+        department (str): Department the order ships to.
+        """
+        index = self._get_index()
+        city, department_in_city = split_place(city)
+        if department is not None and normalize(department) != '':
+            department = normalize(department)
+        else:
+            department = department_in_city
+        if department is not None and (city, department) in index:
+            return index[(city, department)]
+        return index.get((city, None), self._default_fee)
+
+    def import_rates(self,
+                     rates: Iterable[tuple[str, str | None, float]]) -> None:
+        """Adds or replaces many rates with a single write to the rates file.
+
+        Parameters:
+        rates: Rates as (city, department, fee); department may be None.
+        """
+        changes = {}
+        for city, department, fee in rates:
+            field = city.strip() if not department else \
+                    f'{city.strip()}, {department.strip()}'
+            changes[field] = str(fee)
+        file.write_fields(self.filename, changes, add_missing=True)
+
+    def _get_index(self) -> dict[tuple[str, str | None], float]:
+        """Returns the index of rates, rebuilding it if the file changed."""
+        content = file.get_cached_content(self.filename)
+        if content is not self._content:
+            with self._lock:
+                if content is not self._content:
+                    index = {}
+                    for place, fee in content.items():
+                        index[split_place(place)] = float(fee)
+                    self._default_fee = index.get(split_place(DEFAULT_FIELD),
+                                                  0.0)
+                    self._index = index
+                    self._content = content
+        return self._index
+
+
+rates = ShippingRates()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import math
+import threading
+import time
+
+class RateLimiter():
+    """Token bucket per key: every key may spend up to capacity tokens at
+    once, and gets one token back every refill_interval seconds.
+
+    Only the max_keys most recently used keys are remembered; a forgotten
+    key starts again with a full bucket.
+    """
+
+    def __init__(self, capacity: int, refill_interval: float,
+                 max_keys: int = 10000) -> None:
+        self.capacity = capacity
+        self.refill_interval = refill_interval
+        self.max_keys = max_keys
+        # Tokens left and time they were counted at, by key
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def _tokens(self, key: str, now: float) -> float:
+        """Returns tokens a key has at the given time."""
+        if key not in self._buckets:
+            return self.capacity
+        tokens, counted_at = self._buckets[key]
+        return min(self.capacity,
+                   tokens + (now-counted_at)/self.refill_interval)
+
+    def wait_time(self, key: str, now: float) -> float:
+        """Returns seconds a key has to wait for a token, which is 0 if it
+        has one now."""
+        missing = 1 - self._tokens(key, now)
+        return max(missing, 0) * self.refill_interval
+
+    def spend(self, key: str, now: float) -> None:
+        """Takes one token from a key's bucket."""
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+class LoginThrottle():
+    """Limits login attempts per session and per client address.
+
+    An attempt is accepted only if both its session and its address have a
+    token left, and it spends one from each. Rejections cost a few dict
+    lookups, so they are checked before any password is hashed.
+    """
+
+    def __init__(self, *, session_limiter: RateLimiter | None = None,
+                 address_limiter: RateLimiter | None = None) -> None:
+        # 5 attempts at once, then one every 12 seconds
+        self.session_limiter = session_limiter or RateLimiter(5, 12)
+        # Several visitors may share an address, so it gets a larger bucket
+        self.address_limiter = address_limiter or RateLimiter(20, 3)
+        self._lock = threading.Lock()
+        self._counters = {'accepted': 0, 'throttled': 0}
+
+    def metrics(self) -> dict[str, int]:
+        """Returns counters of accepted and throttled attempts."""
+
+        with self._lock:
+            return dict(self._counters)
+
+    def check(self, session_id: str, address: str | None = None) -> int:
+        """Records a login attempt if it is allowed.
+
+        Parameters:
+        session_id (str): ID of the session the attempt comes from.
+        address (str): Address of the client, if known.
+
+        Returns:
+        int: Seconds to wait before trying again, 0 if the attempt is
+        accepted.
+        """
+        now = time.monotonic()
+        limits = [(self.session_limiter, session_id)]
+        if address is not None:
+            limits.append((self.address_limiter, address))
+        with self._lock:
+            wait = max(limiter.wait_time(key, now) for limiter, key in limits)
+            if wait > 0:
+                self._counters['throttled'] += 1
+                return math.ceil(wait)
+            for limiter, key in limits:
+                limiter.spend(key, now)
+            self._counters['accepted'] += 1
+            return 0
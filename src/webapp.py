@@ -1,12 +1,19 @@
 from functools import wraps
 from typing import Any
+import inspect
 
 import justpy as jp
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
 
 import model
 import database as db
 import file_handling as file
 import hasher
+import media
+import migrations
+import throttling
 
 button_classes = 'flex items-center bg-pink-400 hover:bg-pink-500 w-full '\
                  'text-white font-bold py-2 px-4 rounded-lg justify-center'
@@ -15,8 +22,17 @@ input_classes = 'border-2 rounded-lg w-full py-2 px-3 text-gray-700 '\
                 'focus:border-pink-400'
 label_classes = 'block uppercase tracking-wide text-gray-700 text-sm '\
                 'font-semibold mx-3'
-cart = model.Cart()
-admin_sessions = {}
+# Number of products loaded at a time in each catalogue tab
+CATALOGUE_PAGE_SIZE = 24
+# Number of orders loaded at a time in the admin's orders tab
+ORDERS_PAGE_SIZE = 20
+# Number of products listed at a time in the admin's search results
+SEARCH_RESULTS_PAGE_SIZE = 20
+# Path images are uploaded to before the form they belong to is submitted
+UPLOAD_PATH = '/upload/image'
+carts = model.CartStore(persist=True, reserve_stock=True)
+admin_sessions = model.AdminSessionStore(persist=True)
+login_throttle = throttling.LoginThrottle()
 
 def display_pdp(product: model.Product, div: jp.Div) -> None:
     """Adds Product Detail Page of a product.
@@ -45,7 +61,15 @@ def display_pdp(product: model.Product, div: jp.Div) -> None:
         for component in div.components:
             component.show = True
 
-    def add_to_cart_click(caller, msg) -> None:
+    def add_item(session_id: str, quantity: str, color: str,
+                 size: str) -> None:
+        """Adds item to the session's cart, reserving its units, and saves
+        the cart."""
+        carts.get(session_id).add_item(product.product_id, quantity, color,
+                                       size)
+        carts.save(session_id)
+    
+    async def add_to_cart_click(caller, msg) -> None:
         """Adds item to cart if input and selections are valid and indicates
         errors or success in carrying out the operation.
         
@@ -67,8 +91,10 @@ def display_pdp(product: model.Product, div: jp.Div) -> None:
             indication += 'Debe indicar una talla. '
         if indication == '':
             try:
-                # Attempts adding item to cart
-                cart.add_item(product.product_id, quantity, color, size)
+                # Attempts adding item to the session's cart; reserving
+                # units and saving the cart write to the database
+                await db.run_async(add_item, msg.session_id, quantity,
+                                   color, size)
                 indication = 'El producto se ha añadido al carrito.'
             except:
                 indication = 'No hay suficientes unidades disponibles.'
@@ -78,6 +104,8 @@ def display_pdp(product: model.Product, div: jp.Div) -> None:
         """Empties indication text."""
         indication_div.text = ''
     
+    # Gets the product's latest version from the catalogue
+    product = model.catalogue.get(product.product_id) or product
     # Makes components in div stop showing
     for component in div.components:
         component.show = False
@@ -90,7 +118,7 @@ def display_pdp(product: model.Product, div: jp.Div) -> None:
                        classes='bg-gray-200 overflow-auto m-5 justify-center')
     if product.images != 'Por añadir':
         for image in product.images.split('-'):
-            image_div.add(jp.Img(src=f'/static/media/{image}',
+            image_div.add(jp.Img(src=media.url(image, 'detail'),
                                 classes='overflow-y-auto'))
     # Adds container for elements other than images
     text_div = jp.Div(a=pdp_div, classes='flex flex-col m-4 items-center '\
@@ -165,6 +193,43 @@ def display_pdp(product: model.Product, div: jp.Div) -> None:
     color_select.on('click', empty_indication)
     size_select.on('click', empty_indication)
 
+# Clicks the "Ver más" buttons of the catalogue and of the search results
+# as they scroll into view, so the next page is loaded without a click.
+# Buttons are observed again a moment after each click, which loads another
+# page if the one just added did not push the button out of view. Vue adds
+# and replaces buttons as tabs change, so new ones are looked for on every
+# change to the page.
+SCROLL_SCRIPT = """
+<script>
+(function () {
+    const observed = new WeakSet();
+    const observer = new IntersectionObserver(function (entries) {
+        for (const entry of entries) {
+            if (!entry.isIntersecting) {
+                continue;
+            }
+            const button = entry.target;
+            observer.unobserve(button);
+            button.click();
+            setTimeout(function () {
+                if (button.isConnected) {
+                    observer.observe(button);
+                }
+            }, 500);
+        }
+    });
+    new MutationObserver(function () {
+        for (const button of document.querySelectorAll('.load-more')) {
+            if (!observed.has(button)) {
+                observed.add(button);
+                observer.observe(button);
+            }
+        }
+    }).observe(document.body, {childList: true, subtree: true});
+})();
+</script>
+"""
+
 def shop_section(section_div: jp.Div) -> None:
     """Adds components showcasing the available products, filtered by
     categories.
@@ -188,53 +253,163 @@ def shop_section(section_div: jp.Div) -> None:
         div = caller.d
         display_pdp(product, div)
         
+    def add_product_layouts(grid_div: jp.Div, products_div: jp.Div,
+                            products: list[model.Product]) -> None:
+        """Adds a layout for each of the given products to a grid.
+        
+        Parameters:
+        grid_div (Div): Div the layouts will be added to.
+        products_div (Div): Div the Product Detail Page will be rendered in.
+        products (list): Products to showcase.
+        """
+        for product in products:
+            # Creates container for individual product layout
+            product_layout = jp.Div(a=grid_div, classes='flex '\
+                                    'flex-col m-4 p-4 inline-block '\
+                                    'items-center text-md font-semibold '\
+                                    'hover:bg-gray-100 cursor-pointer '\
+                                    'rounded-lg w-96')
+            # Adds components to product layout
+            image = product.images.split('-')[0]
+            jp.Img(a=product_layout, src=media.url(image, 'grid'),
+                   classes='overflow-hidden w-full')
+            jp.P(a=product_layout, text=product.name.upper(),
+                 classes='text-pink-400 mt-3')
+            jp.P(a=product_layout, text=f'${product.price}')
+            product_layout.product = product
+            product_layout.d = products_div
+            product_layout.on('click', show_pdp)
+    
+    def load_next_page(caller, msg) -> None:
+        """Adds the next page of products to the caller's grid and removes
+        the caller once there are no more pages.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function; it contains
+        the grid, its category and the cursor of the next page.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        products, caller.cursor = model.catalogue.page(
+            caller.category,
+            after=caller.cursor,
+            limit=CATALOGUE_PAGE_SIZE,
+        )
+        add_product_layouts(caller.grid_div, caller.products_div, products)
+        if caller.cursor is None:
+            caller.products_div.remove(caller)
+            caller.delete()
+    
+    def build_products_div(category: str | None) -> jp.Div:
+        """Returns Div showcasing the first page of available products of a
+        category, with a button that loads the following pages.
+        
+        Parameters:
+        category (str): Category of the products. Products of all
+        categories are showcased if it is None.
+        """
+        products_div = jp.Div(classes='flex flex-col items-center '\
+                              'relative overflow-y-auto')
+        grid_div = jp.Div(a=products_div, classes='flex flex-wrap '\
+                          'content-start place-content-around '\
+                          'justify-center w-full')
+        more_btn = jp.Button(a=products_div, text='Ver más',
+                             classes=f'{button_classes} load-more my-5',
+                             style='width: 300px')
+        more_btn.grid_div = grid_div
+        more_btn.products_div = products_div
+        more_btn.category = category
+        more_btn.cursor = None
+        more_btn.on('click', load_next_page)
+        # Adds first page
+        load_next_page(more_btn, None)
+        return products_div
+    
+    async def load_next_results(caller, msg) -> None:
+        """Adds the next page of search results to the caller's grid and
+        removes the caller once there are no more pages.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function; it contains
+        the grid, the search and the offset of the next page.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        products, caller.cursor = await db.run_async(
+            model.Product.search,
+            caller.query,
+            offset=caller.cursor,
+            limit=CATALOGUE_PAGE_SIZE,
+            available_only=True,
+        )
+        add_product_layouts(caller.grid_div, caller.products_div, products)
+        if caller.cursor is None:
+            caller.products_div.remove(caller)
+            caller.delete()
+    
+    async def search_products(caller: jp.Form, msg) -> None:
+        """Replaces the category tabs with the available products that
+        match the search, or brings the tabs back if the search is empty.
+        
+        Parameters:
+        caller (Form): Form the search is submitted from.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        query = ''
+        for input in msg.form_data:
+            if input.name == 'busqueda':
+                query = input.value.strip()
+        results_div.delete_components()
+        if query == '':
+            results_div.show = False
+            category_nav_bar.show = True
+            return
+        # Same layout as a category tab, but with ranked results
+        products_div = jp.Div(a=results_div, classes='flex flex-col '\
+                              'items-center relative overflow-y-auto')
+        grid_div = jp.Div(a=products_div, classes='flex flex-wrap '\
+                          'content-start place-content-around '\
+                          'justify-center w-full')
+        more_btn = jp.Button(a=products_div, text='Ver más',
+                             classes=f'{button_classes} load-more my-5',
+                             style='width: 300px')
+        more_btn.grid_div = grid_div
+        more_btn.products_div = products_div
+        more_btn.query = query
+        more_btn.cursor = 0
+        more_btn.on('click', load_next_results)
+        # Adds first page
+        await load_next_results(more_btn, None)
+        if len(grid_div.components) == 0:
+            jp.P(a=grid_div, classes='m-10',
+                 text=f'No se encontraron productos para "{query}".')
+        category_nav_bar.show = False
+        results_div.show = True
+        
     products_div = jp.Div(a=section_div, style='width: 100%; height: 100%;')
     jp.Br(a=products_div)
+    # Adds search box; an empty search goes back to the categories
+    search_form = jp.Form(a=products_div, classes='flex justify-center '\
+                          'space-x-3 mb-5 mx-auto', style='width: 600px')
+    jp.Input(a=search_form, name='busqueda', type='search',
+             classes=input_classes, placeholder='Buscar productos')
+    jp.Button(a=search_form, type='submit', text='Buscar',
+              classes=button_classes, style='width: 150px')
+    search_form.on('submit', search_products)
+    results_div = jp.Div(a=products_div, classes='w-full', show=False)
     # Adds navigation bar for categories
     category_nav_bar = model.TabsPills(a=products_div, classes='w-full',
                                        content_height='100%')
-    for category in ['Todos los productos', 'Prendas Superiores',
-                     'Pantalones', 'Faldas', 'Accesorios', 'Maquillaje']:
-        products_div = jp.Div(classes='flex flex-wrap content-start '\
-                              'place-content-around justify-center '\
-                              'relative overflow-y-auto')
-        # Gets available products
-        result_proxy = db.get_table_objects(
-            model.Product,
-            model.Product.available_units > 0,
+    # Adds tab for every category to category navigation bar; their products
+    # are only read from the catalogue once the tab is selected
+    category_nav_bar.add_tab('idTodos los productos', 'Todos los productos',
+                             builder=lambda: build_products_div(None))
+    for category in model.Category:
+        category_nav_bar.add_tab(
+            f'id{category.value}', f'{category.value}',
+            builder=lambda category=category.value: build_products_div(category),
         )
-        for row in result_proxy:
-            if (category=='Todos los productos' 
-                or (category!='Todos los productos' 
-                    and row.category==category)):
-                # Creates container for individual product layout
-                product_layout = jp.Div(a=products_div, classes='flex '\
-                                        'flex-col m-4 p-4 inline-block '\
-                                        'items-center text-md font-semibold '\
-                                        'hover:bg-gray-100 cursor-pointer '\
-                                        'rounded-lg w-96')
-                # Adds components to product layout
-                image = row.images.split('-')[0]
-                jp.Img(a=product_layout, src=f'/static/media/{image}',
-                       classes='overflow-hidden w-full')
-                jp.P(a=product_layout, text=row.name.upper(),
-                     classes='text-pink-400 mt-3')
-                jp.P(a=product_layout, text=f'${row.price}')
-                product_layout.product = model.Product(
-                    product_id=row.product_id,
-                    name=row.name,
-                    price=row.price,
-                    category=row.category,
-                    description=row.description,
-                    images=row.images,
-                    colors=row.colors,
-                    sizes=row.sizes,
-                    available_units=row.available_units,
-                )
-                product_layout.d = products_div
-                product_layout.on('click', show_pdp)
-        # Adds tab for category to category navigation bar
-        category_nav_bar.add_tab(f'id{category}', f'{category}', products_div)
 
 def about_section(section_div: jp.Div) -> None:
     """Adds components showing information about the shop and seller.
@@ -265,14 +440,18 @@ def about_section(section_div: jp.Div) -> None:
         jp.Img(a=link, classes='w-12 h-12', src=f'/static/media/icon_{s}.png')
                 
 def display_order(order: model.Order, div: jp.Div,
-                  in_admin_session: bool) -> None:
+                  in_admin_session: bool, on_status_change=None) -> None:
     """Adds components displaying the information of an order to a Div.
     
     Parameters:
-    order (Order): Order that will be displayed.
+    order (Order): Order that will be displayed. Its items and their
+    products must have been loaded with it (see Order.with_items).
     div (Div): Div the display will be rendered in.
     in_admin_session (bool): Indicates if function is called from Admin
     view.
+    on_status_change (function): Called with the IDs of the changed
+    orders and their new status after the status is changed from Admin
+    view. The whole admin page is reloaded if not given.
     """
     def place_info(outer_div: jp.Div,
                    descriptions: dict[str, str|float]) -> None:
@@ -290,7 +469,7 @@ def display_order(order: model.Order, div: jp.Div,
             jp.P(a=d, text=dic[desc])
     
     async def change_order_status(caller, msg) -> None:
-        """Updates current order's status and reloads webpage to show changes.
+        """Updates current order's status and shows changes.
         
         Parameters:
         caller: Justpy object that triggers the event function.
@@ -299,8 +478,11 @@ def display_order(order: model.Order, div: jp.Div,
         """
         current_order = caller.current_order
         updated_status = model.OrderStatus(caller.value)
-        current_order.update_status(updated_status)
-        await admin_wp.reload()
+        await db.run_async(current_order.update_status, updated_status)
+        if on_status_change is not None:
+            on_status_change([current_order.order_id], updated_status)
+        else:
+            await admin_wp.reload()
 
     def return_to_prev(caller, msg) -> None:
         """Returns to the Consult Order page.
@@ -367,11 +549,8 @@ def display_order(order: model.Order, div: jp.Div,
     place_info(details_div, ['Localidad', 'Dirección', 'Código postal'])
     details_div.add(jp.Br())
     place_info(details_div, ['Total'])
-    # Gets order items from database
-    order_items = db.get_table_objects(
-        model.OrderItem,
-        model.OrderItem.order_id == order.order_id,
-    )
+    # Order items were loaded alongside the order
+    order_items = order.orderitems
     # Adds container for order items table
     table_div = jp.Div(a=order_d, style='height: 240px',
                        classes='justify-center overflow-auto')
@@ -386,7 +565,7 @@ def display_order(order: model.Order, div: jp.Div,
         # Adds table content
         for item in order_items:
             # Verifies whether product related to item is in database
-            if (product:=item.related_product) != None:
+            if (product:=item.product) != None:
                 table.values.append([item.product_id, product.name, 
                                      str(item.quantity), 
                                      item.color.capitalize(), 
@@ -416,7 +595,7 @@ def consult_order_section(section_div: jp.Div) -> None:
     Parameters:
     section_div (Div): Div the section will be rendered in.
     """
-    def show_order(caller, msg) -> None:
+    async def show_order(caller, msg) -> None:
         """Calls for the display of the input's corresponding order or
         informs the input is invalid.
         
@@ -425,7 +604,9 @@ def consult_order_section(section_div: jp.Div) -> None:
         msg: Contains information about the event (is sent automatically as
         parameter alongside caller).
         """
-        fetched_order = db.get_from_db(model.Order, caller.input_obj.value)
+        fetched_order = await db.get_from_db_async(model.Order,
+                                                   caller.input_obj.value,
+                                                   model.Order.with_items())
         caller.input_obj.value = ''
         if fetched_order == None:
             # Indicates no order with input ID exists
@@ -462,7 +643,7 @@ def instructions_section(section_div: jp.Div) -> None:
         jp.Strong(a=div, text=key)
         jp.P(a=div, text=content[key], classes='mb-5')
 
-def cart_section(section_div: jp.Div) -> None:
+async def cart_section(section_div: jp.Div) -> None:
     """Adds components corresponding to the Cart Section.
     
     The Cart Section displays the current session's cart and allows for its
@@ -472,7 +653,8 @@ def cart_section(section_div: jp.Div) -> None:
     this operation. 
     
     Parameters:
-    section_div (Div): Div the section will be rendered in.
+    section_div (Div): Div the section will be rendered in. It contains the
+    ID of the visitor's session and the page's navigation bar as attributes.
     """
         
     async def reload_cart(msg) -> None:
@@ -485,7 +667,7 @@ def cart_section(section_div: jp.Div) -> None:
         parameter alongside caller).
         """
         msg.new_tab = 'idCarrito'
-        return await main_nav_bar.run_event_function('change', msg)
+        return await section_div.nav_bar.run_event_function('change', msg)
     
     async def delete_item(caller, msg) -> None:
         """Deletes item from cart and reloads tab content.
@@ -496,7 +678,10 @@ def cart_section(section_div: jp.Div) -> None:
         msg: Contains information about the event (is sent automatically as
         parameter alongside caller).
         """
-        cart.remove_item(caller.current_item)
+        # Removing an item also releases the stock it reserved
+        cart = await db.run_async(carts.get, msg.session_id)
+        await db.run_async(cart.remove_item, caller.current_item)
+        await db.run_async(carts.save, msg.session_id)
         await reload_cart(msg)
     
     async def change_quantity(caller, msg) -> None:
@@ -513,7 +698,10 @@ def cart_section(section_div: jp.Div) -> None:
         parameter alongside caller).
         """
         try:
-            caller.changes['item'].change_quantity(caller.changes['amount'])
+            cart = await db.run_async(carts.get, msg.session_id)
+            await db.run_async(cart.change_quantity, caller.changes['item'],
+                               caller.changes['amount'])
+            await db.run_async(carts.save, msg.session_id)
             await reload_cart(msg)
         except:
             pass
@@ -540,12 +728,11 @@ def cart_section(section_div: jp.Div) -> None:
             elif input.name == 'Código Postal':
                 data_dict['zipcode'] = input.value
                 
-        # Gets ID for new order
-        new_order_id = db.get_new_id(model.Order.order_id)
-
         # Attempts placing order
         try:
-            cart.place_order(new_order_id, data_dict)
+            cart = await db.run_async(carts.get, msg.session_id)
+            new_order_id = await db.run_async(cart.place_order, data_dict)
+            await db.run_async(carts.save, msg.session_id)
             # Informs the user of the operation's success and shows 
             # them their order ID
             jp.P(a=all_items_div, classes='text-center px-20 py-5',
@@ -566,10 +753,12 @@ def cart_section(section_div: jp.Div) -> None:
             jp.Button(a=all_items_div, text='Salir', classes=button_classes, click=go_back)
     
     def change_delivery_fee(caller, msg) -> None:
-        input_city = caller.value
-        delivery_fee = model.Order.get_delivery_fee(input_city)
+        input_city = total_div.place_inputs['Ciudad'].value
+        input_department = total_div.place_inputs['Departamento'].value
+        delivery_fee = model.Order.get_delivery_fee(input_city,
+                                                    input_department)
         total_div.delivery_p.text = delivery_fee
-        total_div.cart_total_p.text = delivery_fee + cart.cart_total
+        total_div.cart_total_p.text = delivery_fee + total_div.subtotal
             
     async def checkout(caller: jp.Button, msg) -> None:
         """Displays form for user to input their information.
@@ -586,6 +775,7 @@ def cart_section(section_div: jp.Div) -> None:
         # Stops Checkout button
         caller.show = False
         # Adds form for buyer's information
+        total_div.place_inputs = {}
         jp.Br(a=all_items_div)
         form = jp.Form(a=all_items_div, style='height: 290px',
                        classes='flex flex-wrap flex-col justify-start '\
@@ -612,11 +802,12 @@ def cart_section(section_div: jp.Div) -> None:
                                                classes='form-input mb-2', 
                                                maxlength=6, required=True,
                                                minlength=6, a=form)
-            elif label_text == 'Ciudad':
+            elif label_text in ('Ciudad', 'Departamento'):
                 label.for_component = jp.Input(a=form, name=label_text, 
                                                classes='form-input mb-2',
                                                change=change_delivery_fee,
                                                required=True)
+                total_div.place_inputs[label_text] = label.for_component
             else:
                 label.for_component = jp.Input(a=form, name=label_text, 
                                                classes='form-input mb-2',
@@ -626,6 +817,9 @@ def cart_section(section_div: jp.Div) -> None:
         submit_button.remove_class('w-full')
         form.on('submit', submit_order_form)
     
+    # Loads the products of every item in the session's cart at once
+    cart = await db.run_async(carts.get, section_div.session_id)
+    cart_lines, subtotal = await db.run_async(cart.price_items)
     # Adds container for cart items
     all_items_div = jp.Div(a=section_div, classes='overflow-auto m-6', style='width: 980px')
     # Adds headers
@@ -639,18 +833,19 @@ def cart_section(section_div: jp.Div) -> None:
         else:
             jp.P(a=item_div, text=header)
     # Adds content
-    if len(cart.cart_items) > 0:
-        for item in cart.cart_items:
+    if len(cart_lines) > 0:
+        for line in cart_lines:
+            item = line.item
             item_div = jp.Div(a=all_items_div, classes='grid grid-cols-12 '\
                             'text-center py-2 border-b-1')
-            if (product:=item.related_product) != None:
+            if (product:=line.product) != None:
                 # Adds item information if the product it is related to exists
                 for attribute in (item.product_id, product.name, item.quantity,
-                            item.color, item.size, item.item_total):
+                            item.color, item.size, line.total):
                     if attribute == product.name:
                         jp.P(a=item_div, text=attribute, 
                             classes='col-span-3')
-                    elif attribute in (item.color, item.size, item.item_total):
+                    elif attribute in (item.color, item.size, line.total):
                         jp.P(a=item_div, text=str(attribute).capitalize(), 
                             classes='col-span-2')
                     elif attribute == item.quantity:
@@ -713,18 +908,19 @@ def cart_section(section_div: jp.Div) -> None:
                          classes='flex flex-col-reverse bg-gray-200 p-5 mx-5 my-6 '\
                          'rounded-lg')
     # Adds Checkout button
-    if cart.cart_total > 0:
+    if subtotal > 0:
         checkout_btn = jp.Button(a=summary_div, text='Finalizar compra',
                                  classes=f'{button_classes} mt-2')
         checkout_btn.on('click', checkout)
     
     total_div = jp.Div(a=summary_div, classes='grid grid-cols-2')
     jp.P(a=total_div, text='Subtotal', classes='font-semibold text-left')
-    jp.P(a=total_div, text=cart.cart_total, classes='text-right')
+    jp.P(a=total_div, text=subtotal, classes='text-right')
     jp.P(a=total_div, text='Envío', classes='font-semibold text-left')
     total_div.delivery_p = jp.P(a=total_div, text=0, classes='text-right')
     jp.P(a=total_div, text='Total', classes='font-semibold text-left mt-1')
-    total_div.cart_total_p = jp.P(a=total_div, classes='text-right mt-1', text=cart.cart_total)
+    total_div.cart_total_p = jp.P(a=total_div, classes='text-right mt-1', text=subtotal)
+    total_div.subtotal = subtotal
 
     jp.P(a=summary_div, text='RESUMEN DE COMPRA',
          classes='font-semibold text-center text-lg mb-2')
@@ -736,7 +932,7 @@ def admin_section_login(section_div: jp.Div) -> None:
     Parameters:
     section_div (Div): Div the section will be rendered in.
     """
-    def validate_user(form: jp.Form, msg) -> None:
+    async def validate_user(form: jp.Form, msg) -> None:
         """Validates login form. Redirects to Admin page if valid and
         informs of error if not.
         
@@ -745,18 +941,34 @@ def admin_section_login(section_div: jp.Div) -> None:
         msg: Contains information about the event (is sent automatically as
         parameter alongside caller).
         """
+        # Rejects the attempt before any hashing if the session or the
+        # address it comes from has tried too often
+        client = getattr(msg.get('websocket'), 'client', None)
+        wait = login_throttle.check(msg.session_id,
+                                    client.host if client else None)
+        if wait > 0:
+            form.error_indication.text = 'Demasiados intentos. Intente de '\
+                                         f'nuevo en {wait} segundos.'
+            return
         correct_user = file.get_content_by_field('admin.txt', 'Usuario')
         user_is_valid = True
-        for input in msg.form_data:
-            # Verifies input username and password are correct
-            if ((input.name=='usuario' and input.value!=correct_user)
-                or (input.name=='clave' and not hasher.verify_password(input.value))):
-                user_is_valid = False
-                break
+        try:
+            for input in msg.form_data:
+                # Verifies input username and password are correct; the
+                # password is verified off the event loop
+                if ((input.name=='usuario' and input.value!=correct_user)
+                    or (input.name=='clave'
+                        and not await hasher.verify_password_async(input.value))):
+                    user_is_valid = False
+                    break
+        except Exception as e:
+            # Too many passwords are being verified at once
+            form.error_indication.text = str(e)
+            return
         if user_is_valid:
             # Allows access to admin section from the current session and 
             # redirects page to admin section
-            admin_sessions[msg.session_id] = True
+            await db.run_async(admin_sessions.add, msg.session_id)
             msg.page.redirect = '/admin'
         else:
             # Shows user text indicating error
@@ -795,10 +1007,12 @@ main_sections = [
 ]
 
 @jp.SetRoute('/main')  
-def main_page() -> jp.WebPage:
+@db.in_session_scope
+async def main_page(request) -> jp.WebPage:
     """Returns main webpage with all of its components."""
 
-    def reload_content(caller, msg) -> None:
+    @db.in_session_scope
+    async def reload_content(caller, msg) -> None:
         """Reloads content on the tab that is clicked on.
         
         Parameters:
@@ -809,20 +1023,22 @@ def main_page() -> jp.WebPage:
         for section in main_sections:
             if f'id{section.name}' == msg.new_tab:
                 section_div = jp.Div(style=caller.wrapper_style)
-                section.link(section_div)
+                section_div.session_id = msg.session_id
+                section_div.nav_bar = caller
+                await section.render(section_div)
                 for tab in caller.tabs:
                     if tab['id'] == msg.new_tab:
                         tab['content'] = section_div
                         caller.set_content_div(tab)
                         break
     
-    global main_nav_bar
     main_wp = jp.WebPage(template_file='tailwindui.html')
     # Sets the font that will be used
     main_wp.head_html = '<link rel="preconnect" href="https://fonts.googleapis.com">'\
                         '<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>'\
                         '<link href="https://fonts.googleapis.com/css2?family=Poppins:ital,wght@0,300;0,600;0,700;1,700&display=swap" rel="stylesheet">'
     main_wp.css = 'body { font-family: \'Poppins\', sans-serif; }'
+    main_wp.body_html = SCROLL_SCRIPT
     # Creates main container
     wp_div = jp.Div(classes='flex flex-col', a=main_wp,
                     style='font-family: \'Poppins\'')
@@ -842,8 +1058,10 @@ def main_page() -> jp.WebPage:
                                    text_color='white')
     for section in main_sections:
         section_div = jp.Div(style=model.TabsPills.wrapper_style)
+        section_div.session_id = request.session_id
+        section_div.nav_bar = main_nav_bar
         # Adds section content to container
-        section.link(section_div)
+        await section.render(section_div)
         # Adds tab with section content
         main_nav_bar.add_tab(f'id{section.name}', f'{section.name.upper()}', 
                              section_div)
@@ -852,38 +1070,247 @@ def main_page() -> jp.WebPage:
     return main_wp
 
 def valid_session(f):
+    # Allows access to admin section if admin is logged in in the current
+    # session ID, otherwise, it redirects the user to main webpage
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_wrapper(request) -> (Any | jp.WebPage):
+            if await admin_sessions.is_valid_async(request.session_id):
+                return await f(request)
+            else:
+                return jp.redirect('/main')
+        return async_wrapper
+
     @wraps(f)
-    def wrapper(request) -> (Any | jp.WebPage):
-        # Allows access to admin section if admin is logged in in the current
-        # session ID, otherwise, it redirects the user to main webpage
-        if request.session_id in admin_sessions:
+    async def wrapper(request) -> (Any | jp.WebPage):
+        if await admin_sessions.is_valid_async(request.session_id):
             return f(request)
         else:
             return jp.redirect('/main')
     return wrapper
 
-def display_all_orders(section_div: jp.Div) -> None:
-    """Adds components displaying all orders and their respective information.
+async def display_all_orders(section_div: jp.Div) -> None:
+    """Adds components listing orders a page at a time, newest first, with
+    filters by status and date.
+
+    Each order is listed in a single row; its details are only displayed
+    once the row is expanded. Orders can be checked to change the status
+    of all of them at once, or the change can be applied to every order
+    that matches the filters; either way, only the affected rows are
+    updated.
     
     Parameters:
     section_div (Div): Div the section will be rendered in.   
     """
-    # Gets all orders from database
-    all_orders = db.get_table_objects(model.Order)
+    def toggle_details(caller, msg) -> None:
+        """Displays or hides the details of the caller's order, adding them
+        the first time they are displayed.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function; it contains
+        the order and the Div its details are displayed in.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        if len(caller.details_div.components) == 0:
+            display_order(caller.order, caller.details_div, True,
+                          on_status_change=update_rows)
+            caller.details_div.show = True
+        else:
+            caller.details_div.show = not caller.details_div.show
+        caller.text = 'Ocultar' if caller.details_div.show else 'Ver detalle'
+
+    def add_order_rows(orders: list[model.Order]) -> None:
+        """Adds a row for each of the given orders to the orders list.
+        
+        Parameters:
+        orders (list): Orders to list.
+        """
+        for order in orders:
+            row_div = jp.Div(a=orders_div, classes='border-b-2 border-gray-200 '\
+                             'py-2 w-full')
+            summary_div = jp.Div(a=row_div, classes='grid grid-cols-7 '\
+                                 'text-center items-center')
+            row_div.checkbox = jp.Input(a=summary_div, type='checkbox',
+                                        classes='form-checkbox mx-auto')
+            jp.P(a=summary_div, text=order.order_id)
+            jp.P(a=summary_div, text=order.date)
+            row_div.status_p = jp.P(a=summary_div, text=order.status)
+            jp.P(a=summary_div, text=order.buyer_name)
+            jp.P(a=summary_div, text=order.total)
+            details_btn = jp.Button(a=summary_div, text='Ver detalle',
+                                    classes=button_classes)
+            details_btn.order = order
+            details_btn.details_div = jp.Div(a=row_div, show=False,
+                                             classes='flex flex-wrap '\
+                                             'justify-center p-5')
+            details_btn.on('click', toggle_details)
+            row_div.details_btn = details_btn
+            rows[order.order_id] = row_div
+
+    def update_rows(order_ids: list[str], new_status: model.OrderStatus) -> None:
+        """Shows the new status of the given orders in their rows, or
+        removes their rows if they were deleted.
+        
+        Parameters:
+        order_ids (list): IDs of the orders whose status changed.
+        new_status (OrderStatus): New status of the orders.
+        """
+        for order_id in order_ids:
+            row_div = rows.get(order_id)
+            if row_div is None:
+                # Order is not listed
+                continue
+            if new_status == model.OrderStatus.DELIVERED:
+                del rows[order_id]
+                orders_div.remove(row_div)
+                row_div.delete()
+                continue
+            row_div.checkbox.checked = False
+            row_div.status_p.text = new_status.value
+            details_btn = row_div.details_btn
+            details_btn.order.status = new_status.value
+            # Details are built again, with the new status, when expanded
+            for component in list(details_btn.details_div.components):
+                details_btn.details_div.remove(component)
+                component.delete()
+            details_btn.details_div.show = False
+            details_btn.text = 'Ver detalle'
+
+    async def apply_to_checked(caller, msg) -> None:
+        """Changes the status of every checked order.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        checked = [order_id for order_id, row_div in rows.items()
+                   if row_div.checkbox.checked]
+        if len(checked) == 0:
+            bulk_indication.text = 'No se seleccionó ninguna orden.'
+            return
+        new_status = model.OrderStatus(bulk_select.value)
+        updated = await db.run_async(model.Order.update_statuses, new_status,
+                                     order_ids=checked)
+        update_rows(updated, new_status)
+        bulk_indication.text = f'Se actualizaron {len(updated)} órdenes.'
+
+    async def apply_to_filtered(caller, msg) -> None:
+        """Changes the status of every order that matches the filters,
+        including those in pages not loaded yet.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        # Without filters every order in the database would be changed, or
+        # deleted if the new status is DELIVERED
+        if all(value is None for value in filters.values()):
+            bulk_indication.text = 'Aplique al menos un filtro para cambiar '\
+                                   'las órdenes filtradas.'
+            return
+        new_status = model.OrderStatus(bulk_select.value)
+        updated = await db.run_async(model.Order.update_statuses, new_status,
+                                     **filters)
+        update_rows(updated, new_status)
+        bulk_indication.text = f'Se actualizaron {len(updated)} órdenes.'
+
+    async def load_next_page(caller, msg) -> None:
+        """Adds the next page of orders matching the filters to the list and
+        hides the caller once there are no more pages.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        orders, more_btn.cursor = await db.run_async(
+            model.Order.get_page,
+            status=filters['status'],
+            date_from=filters['date_from'],
+            date_to=filters['date_to'],
+            after=more_btn.cursor,
+            limit=ORDERS_PAGE_SIZE,
+        )
+        add_order_rows(orders)
+        more_btn.show = more_btn.cursor is not None
+        if len(orders_div.components) == 0:
+            jp.P(a=orders_div, text='No hay órdenes que mostrar.',
+                 classes='text-center text-lg m-10')
+
+    async def apply_filters(caller, msg) -> None:
+        """Lists, from the first page, the orders that match the filters
+        in the form.
+        
+        Parameters:
+        caller (Form): Filters form.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        for input in msg.form_data:
+            if input.name in filters:
+                filters[input.name] = input.value or None
+        for component in list(orders_div.components):
+            orders_div.remove(component)
+            component.delete()
+        rows.clear()
+        more_btn.cursor = None
+        await load_next_page(caller, msg)
+
+    filters = {'status': None, 'date_from': None, 'date_to': None}
+    # Rows of the listed orders by order ID
+    rows = {}
     jp.Br(a=section_div)
-    # Displays orders if there are any
-    if len(all_orders) > 0:
-        for order in all_orders:
-            order_div = jp.Div(a=section_div,
-                               classes='border-2 border-gray-200 space-y-3 '\
-                               'p-5 my-15 rounded-lg flex flex-wrap w-5/6 '\
-                               'justify-center')
-            display_order(order, order_div, True)
-    else:
-        jp.P(a=section_div, text='No hay órdenes que mostrar.',
-             classes='text-center text-lg m-10')
+    # Adds filters form
+    filters_form = jp.Form(a=section_div, classes='flex flex-row items-end '\
+                           'space-x-5 w-5/6')
+    for name, text in (('status', 'Estado'), ('date_from', 'Desde'),
+                       ('date_to', 'Hasta')):
+        d = jp.Div(a=filters_form, classes='flex flex-col')
+        label = jp.Label(a=d, text=text, classes=label_classes)
+        if name == 'status':
+            label.for_component = jp.Select(a=d, name=name, value='',
+                                            classes=input_classes)
+            label.for_component.add(jp.Option(value='', text='Todos'))
+            for status in model.OrderStatus._value2member_map_:
+                label.for_component.add(jp.Option(value=status, text=status))
+        else:
+            label.for_component = jp.Input(a=d, name=name, type='date',
+                                           classes=input_classes)
+    jp.Input(a=filters_form, type='submit', value='Filtrar',
+             classes=button_classes, style='width: 200px')
+    filters_form.on('submit', apply_filters)
+    # Adds bulk status change controls
+    bulk_div = jp.Div(a=section_div, classes='flex flex-row items-center '\
+                      'space-x-5 mt-5 w-5/6')
+    jp.P(a=bulk_div, text='Cambiar estado a', classes='font-semibold')
+    bulk_select = jp.Select(a=bulk_div, classes=input_classes,
+                            value=model.OrderStatus.APPROVED.value)
+    for status in model.OrderStatus._value2member_map_:
+        bulk_select.add(jp.Option(value=status, text=status))
+    jp.Button(a=bulk_div, text='Aplicar a seleccionadas',
+              classes=button_classes, click=apply_to_checked)
+    jp.Button(a=bulk_div, text='Aplicar a todas las filtradas',
+              classes=button_classes, click=apply_to_filtered)
+    bulk_indication = jp.Div(a=section_div,
+                             classes='text-red-500 text-sm text-center')
+    # Adds headers and orders list
+    header_div = jp.Div(a=section_div, classes='grid grid-cols-7 text-center '\
+                        'font-semibold border-b-2 py-2 mt-5 w-5/6')
+    for header in ('', 'ID', 'Creada', 'Estado', 'Nombre', 'Total', ''):
+        jp.P(a=header_div, text=header)
+    orders_div = jp.Div(a=section_div, classes='flex flex-col w-5/6')
+    more_btn = jp.Button(a=section_div, text='Ver más',
+                         classes=f'{button_classes} my-5',
+                         style='width: 300px')
+    more_btn.cursor = None
+    more_btn.on('click', load_next_page)
+    # Adds first page
+    await load_next_page(more_btn, None)
 
-def submit_modification_form(caller: jp.Form, msg) -> None:
+async def submit_modification_form(caller: jp.Form, msg) -> None:
     error_message = ''
     data = {}
     # Collects form data into a dictionary
@@ -936,7 +1363,7 @@ def submit_modification_form(caller: jp.Form, msg) -> None:
                 sizes=data['Tallas'],
                 available_units=int(data['Unidades disponibles']),
             )
-            modified_product.update_product()
+            await db.run_async(modified_product.update_product)
             # Redirects to admin page
             msg.page.redirect = '/admin'
         except Exception as e:
@@ -945,7 +1372,8 @@ def submit_modification_form(caller: jp.Form, msg) -> None:
    
 @jp.SetRoute('/modify_product/{id}')
 @valid_session
-def product_modification_page(request) -> jp.WebPage:
+@db.in_session_scope
+async def product_modification_page(request) -> jp.WebPage:
     product_mod_wp = jp.WebPage()
     d = jp.Div(a=product_mod_wp, classes='flex flex-col items-center w-full')
     jp.P(a=d, classes='px-12 pt-5', style='width: 1000px', 
@@ -965,7 +1393,8 @@ def product_modification_page(request) -> jp.WebPage:
     product_form = jp.Form(a=d, style='width: 1000px', 
                            classes='flex flex-wrap flex-col justify-start '\
                            'space-x-5 p-8')
-    product = db.get_from_db(model.Product, request.path_params['id'])
+    product = await db.get_from_db_async(model.Product,
+                                         request.path_params['id'])
     for t in ('Nombre', 'Descripcion', 'Colores', 'Tallas'):
         label = jp.Label(a=product_form, text=t, classes=label_classes)
         if t == 'Nombre':
@@ -1029,8 +1458,9 @@ def modify_products(section_div: jp.Div) -> None:
     Parameters:
     section_div (Div): Div the section will be rendered in.   
     """
-    def delete_product(caller, msg) -> None:
-        fetched_product = db.get_from_db(model.Product, id_input.value)
+    async def delete_product(caller, msg) -> None:
+        fetched_product = await db.get_from_db_async(model.Product,
+                                                     id_input.value)
         id_input.value = ''
         if fetched_product is None:
             # Indicates no product with input ID exists
@@ -1048,11 +1478,12 @@ def modify_products(section_div: jp.Div) -> None:
                 sizes=fetched_product.sizes,
                 available_units=fetched_product.available_units,
             )
-            p.delete_product()
+            await db.run_async(p.delete_product)
             id_input.indication.text = 'Producto eliminado con éxito.'
     
-    def modify_product(caller, msg) -> None:
-        fetched_product = db.get_from_db(model.Product, id_input.value)
+    async def modify_product(caller, msg) -> None:
+        fetched_product = await db.get_from_db_async(model.Product,
+                                                     id_input.value)
         id_input.value = ''
         if fetched_product is None:
             # Indicates no product with input ID exists
@@ -1064,9 +1495,83 @@ def modify_products(section_div: jp.Div) -> None:
     
     def empty_indication(caller, msg) -> None:
         id_input.indication.text = ''
+    
+    def choose_result(caller, msg) -> None:
+        # Fills in the ID of the product clicked among the search results
+        id_input.value = caller.product_id
+        id_input.indication.text = ''
+    
+    async def load_next_results(caller, msg) -> None:
+        """Adds the next page of search results to the results list and
+        removes the caller once there are no more pages.
+        
+        Parameters:
+        caller: Justpy object that triggers the event function; it contains
+        the search and the offset of the next page.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        products, caller.cursor = await db.run_async(
+            model.Product.search,
+            caller.query,
+            offset=caller.cursor,
+            limit=SEARCH_RESULTS_PAGE_SIZE,
+        )
+        for product in products:
+            result = jp.Div(a=results_div, classes='flex justify-between '\
+                            'w-full px-3 py-2 hover:bg-gray-100 '\
+                            'cursor-pointer rounded-lg', click=choose_result)
+            jp.Span(a=result, text=product.product_id,
+                    classes='font-semibold text-pink-400 mr-3')
+            jp.Span(a=result, text=product.name, classes='flex-grow')
+            jp.Span(a=result, classes='text-gray-500 text-sm ml-3',
+                    text=f'{product.category} · '\
+                    f'{product.available_units} unidades')
+            result.product_id = product.product_id
+        if caller.cursor is None:
+            caller.show = False
+        else:
+            # Keeps the button after the results it loads
+            results_div.remove(caller)
+            results_div.add(caller)
+    
+    async def search_products(caller: jp.Form, msg) -> None:
+        """Lists the products that match the search, so that the ID of
+        one of them can be chosen without knowing it beforehand.
+        
+        Parameters:
+        caller (Form): Form the search is submitted from.
+        msg: Contains information about the event (is sent automatically as
+        parameter alongside caller).
+        """
+        query = ''
+        for input in msg.form_data:
+            if input.name == 'busqueda':
+                query = input.value.strip()
+        results_div.delete_components()
+        if query == '':
+            return
+        more_btn = jp.Button(a=results_div, text='Ver más',
+                             classes=f'{button_classes} mt-3')
+        more_btn.query = query
+        more_btn.cursor = 0
+        more_btn.on('click', load_next_results)
+        await load_next_results(more_btn, None)
+        if len(results_div.components) == 1:
+            jp.P(a=results_div, classes='text-sm text-center',
+                 text=f'No se encontraron productos para "{query}".')
             
     d = jp.Div(a=section_div, style='width: 400px', 
                classes='flex flex-col items-center m-10 w-full')
+    search_form = jp.Form(a=d, classes='flex space-x-3 mb-3 w-full')
+    jp.Input(a=search_form, name='busqueda', type='search',
+             classes=input_classes, placeholder='Buscar por nombre, '\
+             'descripción, color o categoría')
+    jp.Button(a=search_form, type='submit', text='Buscar',
+              classes=button_classes, style='width: 120px')
+    search_form.on('submit', search_products)
+    results_div = jp.Div(a=d, classes='flex flex-col overflow-y-auto '\
+                         'w-full mb-5', style='max-height: 400px')
     id_input = jp.Input(a=d, classes=input_classes+' mb-5',
                         placeholder='Ingrese ID de producto')
     id_input.indication = jp.Div(classes='text-red-500 text-sm text-center',
@@ -1078,11 +1583,82 @@ def modify_products(section_div: jp.Div) -> None:
     jp.Button(a=d, classes=button_classes, text='Modificar producto',
               click=modify_product)
     
-def submit_product_form(caller, msg) -> None:
+async def upload_image(request: Request) -> Response:
+    """Receives an image sent as the body of a POST request from the new
+    product page and returns the name it was uploaded under, which the
+    page's form is then submitted with.
+
+    The body is written to disk as it arrives, so that its size and type
+    are checked without ever holding the whole image in memory.
+    """
+    try:
+        session_id = jp.cookie_signer.unsign(
+            request.cookies[jp.SESSION_COOKIE_NAME]).decode('utf-8')
+    except:
+        session_id = None
+    if (session_id is None
+            or not await admin_sessions.is_valid_async(session_id)):
+        return PlainTextResponse('Sesión no válida.', status_code=403)
+    # Declared sizes are checked before reading any of the body; the size
+    # of chunked bodies is checked as they arrive
+    length = request.headers.get('content-length', '0')
+    if length.isdigit() and int(length) > media.MAX_UPLOAD_BYTES:
+        return PlainTextResponse('La imagen supera el tamaño máximo de '
+                                 f'{media.MAX_UPLOAD_BYTES // 2**20} MB.',
+                                 status_code=413)
+    try:
+        name = await media.receive_upload(request.stream())
+    except Exception as e:
+        return PlainTextResponse(str(e), status_code=400)
+    return JSONResponse({'name': name})
+
+# Uploads the images chosen in the new product page one at a time, as soon
+# as they are chosen, and keeps the names they were uploaded under in the
+# form's hidden input. The file input is plain HTML, so justpy never reads
+# the files to send them through the websocket.
+UPLOAD_SCRIPT = """
+<script>
+document.addEventListener('change', async function (event) {
+    const input = event.target;
+    if (input.id !== 'product-images') {
+        return;
+    }
+    const names = document.getElementById('product-image-names');
+    const status = document.getElementById('product-images-status');
+    const submit = input.form.querySelector('button[type=submit]');
+    const uploaded = [];
+    names.value = '';
+    submit.disabled = true;
+    try {
+        for (const image of input.files) {
+            status.textContent = 'Subiendo ' + image.name + '...';
+            const response = await fetch('%s', {
+                method: 'POST', body: image, credentials: 'same-origin'
+            });
+            if (!response.ok) {
+                throw new Error(image.name + ': ' + await response.text());
+            }
+            uploaded.push((await response.json()).name);
+        }
+        names.value = uploaded.join('-');
+        status.textContent = '';
+    } catch (error) {
+        input.value = '';
+        status.textContent = error.message;
+    }
+    submit.disabled = false;
+});
+</script>
+""" % UPLOAD_PATH
+
+async def submit_product_form(caller, msg) -> None:
     error_message = ''
     data = {}
     # Collects form data into a dictionary
     for input in msg.form_data:
+        if input.type == 'file':
+            # Images were already uploaded; their names are in 'Imagenes'
+            continue
         if input.name=='Colores' or input.name=='Tallas':
             if input.value.find('-') != -1:
                 # Informs of error if input contains "-"
@@ -1112,8 +1688,6 @@ def submit_product_form(caller, msg) -> None:
                     data[input.name] = data[input.name][:-1]
         elif input.value.strip() == '':
             data[input.name] = '.'
-        elif input.type=='file':
-            data['img'] = input
         else:
             data[input.name] = input.value.strip()
         if len(data) == 8:
@@ -1135,7 +1709,9 @@ def submit_product_form(caller, msg) -> None:
                 available_units=int(data['Unidades disponibles']),
             )
             # Adds to database
-            new_product.add_product(data['img'])
+            uploads = [] if data['Imagenes'] == '.' else \
+                      data['Imagenes'].split('-')
+            await db.run_async(new_product.add_product, uploads)
             # Redirects to admin page
             msg.page.redirect = '/admin'
         except Exception as e:
@@ -1144,6 +1720,7 @@ def submit_product_form(caller, msg) -> None:
     
 @jp.SetRoute('/new_product')
 @valid_session
+@db.in_session_scope
 def new_product_page(request) -> jp.WebPage:
     new_product_wp = jp.WebPage()
     d = jp.Div(a=new_product_wp, classes='flex flex-col items-center w-full')
@@ -1185,8 +1762,15 @@ def new_product_page(request) -> jp.WebPage:
         category_select.add(jp.Option(value=cat, text=cat))
     label_cat.for_component = category_select
     
-    jp.Input(a=product_form, type='file', accept='image/*', multiple=True,
-             classes=jp.Styles.input_classes+' mb-5 w-full', required=True)
+    # Plain HTML, uploaded by UPLOAD_SCRIPT rather than through justpy
+    jp.Div(a=product_form, classes='mb-5 w-full', inner_html=
+           '<input type="file" id="product-images" accept="image/jpeg,'
+           'image/png,image/gif,image/webp" multiple required '
+           f'class="{input_classes}">'
+           '<input type="hidden" id="product-image-names" name="Imagenes">'
+           '<div id="product-images-status" '
+           'class="text-gray-700 text-sm text-center"></div>')
+    new_product_wp.body_html = UPLOAD_SCRIPT
     
     # Adds div where indication will be displayed
     product_form.indication = jp.Div(a=product_form,
@@ -1216,10 +1800,13 @@ def modify_profile(section_div: jp.Div) -> None:
     section_div(Div): Div the section will be rendered in.
     """
     def save_changes(caller: jp.Form, msg) -> None:
+        changes = {}
         for input in msg.form_data:
             if input.name in ('Quienes somos', 'Correo',
                               'Instagram', 'TikTok'):
-                file.write_over_file('perfil.txt', input.name, input.value)
+                changes[input.name] = input.value
+        # Writes all fields at once
+        file.write_fields('perfil.txt', changes)
         form.indication.text = 'Los cambios fueron realizados con éxito.'
     
     def empty_indication(caller, msg) -> None:
@@ -1256,7 +1843,7 @@ def modify_account(section_div: jp.Div) -> None:
     Parameters:
     section_div(Div): Div the section will be rendered in.
     """
-    def save_account_changes(caller: jp.Form, msg) -> None:
+    async def save_account_changes(caller: jp.Form, msg) -> None:
         data = {}
         for input in msg.form_data:
             if input.name in ('Contraseña actual', 'Nueva contraseña', 'Nuevo usuario'):
@@ -1265,9 +1852,10 @@ def modify_account(section_div: jp.Div) -> None:
                 else:
                     data[input.name] = input.value
         try:
-            hasher.change_account_info(current_password=data['Contraseña actual'],
-                                       new_password=data['Nueva contraseña'],
-                                       new_user=data['Nuevo usuario'])
+            await hasher.change_account_info_async(
+                current_password=data['Contraseña actual'],
+                new_password=data['Nueva contraseña'],
+                new_user=data['Nuevo usuario'])
             if data['Nueva contraseña'] != None:
                 acc_form.indication.text = 'Se cambió la contraseña.'
             if data['Nuevo usuario'] != None:
@@ -1309,7 +1897,8 @@ admin_sections = [
 
 @jp.SetRoute('/admin')
 @valid_session
-def admin_section(request) -> jp.WebPage:
+@db.in_session_scope
+async def admin_section(request) -> jp.WebPage:
     """Returns admin webpage with all of its components."""
     global admin_wp
     
@@ -1317,7 +1906,8 @@ def admin_section(request) -> jp.WebPage:
         """Redirects to main webpage."""
         msg.page.redirect = '/main'
         
-    def reload_content(caller, msg) -> None:
+    @db.in_session_scope
+    async def reload_content(caller, msg) -> None:
         """Reloads content on the tab that is clicked on.
         
         Parameters:
@@ -1328,7 +1918,7 @@ def admin_section(request) -> jp.WebPage:
         for section in admin_sections:
             if f'id{section.name}' == msg.new_tab:
                 section_div = jp.Div(style=caller.wrapper_style)
-                section.link(section_div)
+                await section.render(section_div)
                 for tab in caller.tabs:
                     if tab['id'] == msg.new_tab:
                         tab['content'] = section_div
@@ -1358,7 +1948,7 @@ def admin_section(request) -> jp.WebPage:
     for section in admin_sections:
         section_div = jp.Div(style=model.TabsPills.wrapper_style)
         # Adds section content to container
-        section.link(section_div)
+        await section.render(section_div)
         # Adds tab with section content
         admin_nav_bar.add_tab(f'id{section.name}', f'{section.name.upper()}', 
                               section_div)
@@ -1366,4 +1956,11 @@ def admin_section(request) -> jp.WebPage:
         
     return admin_wp
 
+migrations.upgrade()
+model.catalogue.load()
+admin_sessions.start_sweeper()
+carts.start_sweeper(interval=60*60)
+media.collector.start_sweeper()
+media.mount(jp.app)
+jp.app.routes.insert(0, Route(UPLOAD_PATH, upload_image, methods=['POST']))
 jp.justpy(main_page)
@@ -0,0 +1,39 @@
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import database as db
+
+DATA_FILES = ('shop.db', 'admin.txt', 'ayuda.txt', 'costo_envios.txt',
+              'perfil.txt')
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    """Copy of the shop's data files in a temporary folder, which becomes
+    the working directory, with the database layer pointed at its copy of
+    shop.db."""
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(ROOT, name), tmp_path)
+    (tmp_path / 'media').mkdir()
+    monkeypatch.chdir(tmp_path)
+    db.configure_engine(f'sqlite:///{tmp_path}/shop.db')
+    yield tmp_path
+    db.dispose_engine()
+
+@pytest.fixture
+def webapp(shop):
+    """src/webapp.py run on the copy of the shop, without starting the
+    server."""
+    path = os.path.join(ROOT, 'src', 'webapp.py')
+    with open(path, encoding='utf-8') as f:
+        source = f.read().replace('jp.justpy(main_page)', '')
+    module = types.ModuleType('webapp')
+    module.__file__ = path
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, select
+
+import database as db
+import migrations
+import model
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Current time as seen by the model, which tests move forward."""
+    now = [1000.0]
+    monkeypatch.setattr(model.time, 'time', lambda: now[0])
+    return now
+
+def stored_sessions() -> set[str]:
+    with db.session_scope() as session:
+        return set(session.execute(
+            select(model.StoredAdminSession.session_id)).scalars())
+
+def test_sessions_expire_after_absolute_ttl_even_if_used(clock):
+    sessions = model.AdminSessionStore(idle_ttl=60, absolute_ttl=100)
+    sessions.add('admin')
+    for _ in range(3):
+        clock[0] += 30
+        assert sessions.is_valid('admin')
+    clock[0] += 30
+    assert not sessions.is_valid('admin')
+    assert sessions.metrics['live'] == 0
+
+def test_sessions_expire_after_idle_ttl(clock):
+    sessions = model.AdminSessionStore(idle_ttl=60, absolute_ttl=1000)
+    sessions.add('admin')
+    clock[0] += 50
+    # Each use starts the idle time again
+    assert sessions.is_valid('admin')
+    clock[0] += 50
+    assert sessions.is_valid('admin')
+    clock[0] += 61
+    assert not sessions.is_valid('admin')
+
+def test_logins_beyond_max_sessions_end_least_recently_used(clock):
+    sessions = model.AdminSessionStore(max_sessions=2)
+    sessions.add('first')
+    sessions.add('second')
+    clock[0] += 1
+    assert sessions.is_valid('first')
+    sessions.add('third')
+    assert not sessions.is_valid('second')
+    assert sessions.is_valid('first')
+    assert sessions.is_valid('third')
+    assert sessions.metrics['evicted_lru'] == 1
+
+def test_sweep_ends_expired_sessions_in_memory_and_database(shop, clock):
+    migrations.upgrade()
+    sessions = model.AdminSessionStore(idle_ttl=60, persist=True)
+    sessions.add('old')
+    clock[0] += 50
+    sessions.add('recent')
+    clock[0] += 20
+
+    sessions.sweep()
+
+    assert sessions.metrics['live'] == 1
+    assert sessions.metrics['expired'] == 1
+    assert stored_sessions() == {'recent'}
+
+def test_sessions_are_restored_by_a_new_store(shop, clock):
+    migrations.upgrade()
+    model.AdminSessionStore(idle_ttl=60, persist=True).add('admin')
+    clock[0] += 30
+    # As after a restart, or in another process
+    sessions = model.AdminSessionStore(idle_ttl=60, persist=True)
+    assert sessions.is_valid('admin')
+    assert sessions.metrics['live'] == 1
+    assert not sessions.is_valid('stranger')
+
+    clock[0] += 61
+    later = model.AdminSessionStore(idle_ttl=60, persist=True)
+    assert not later.is_valid('admin')
+    assert stored_sessions() == set()
+
+def test_checks_only_reach_database_to_store_last_access(shop, clock):
+    migrations.upgrade()
+    sessions = model.AdminSessionStore(idle_ttl=10*60, persist=True)
+    sessions.add('admin')
+    statements = []
+    event.listen(db.get_engine(), 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+
+    clock[0] += 1
+    assert asyncio.run(sessions.is_valid_async('admin'))
+    assert statements == []
+    clock[0] += model.AdminSessionStore.TOUCH_INTERVAL
+    assert asyncio.run(sessions.is_valid_async('admin'))
+    assert len(statements) == 1
+    assert statements[0].startswith('UPDATE')
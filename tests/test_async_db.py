@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+import justpy as jp
+from sqlalchemy import select, text
+
+import database as db
+import model
+
+# Takes a few hundred milliseconds in SQLite, which releases the GIL while
+# it runs
+SLOW_QUERY = text('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL '
+                  'SELECT x+1 FROM c WHERE x < 2000000) SELECT COUNT(*) FROM c')
+
+def slow_query() -> int:
+    with db.session_scope() as session:
+        return session.execute(SLOW_QUERY).scalar()
+
+async def delays_of_other_session(in_worker: bool) -> tuple[float, float]:
+    """Returns how long the slow query took and the longest an event of
+    another session, which reads a product, took while it ran."""
+    delays = []
+    stop = asyncio.Event()
+
+    async def other_session() -> None:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await db.get_from_db_async(model.Product, '000002')
+            await asyncio.sleep(0.005)
+            delays.append(time.perf_counter()-start-0.005)
+
+    task = asyncio.create_task(other_session())
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    if in_worker:
+        await db.run_async(slow_query)
+    else:
+        slow_query()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await task
+    return elapsed, max(delays)
+
+def test_slow_query_in_worker_does_not_delay_other_sessions(shop):
+    elapsed, delay = asyncio.run(delays_of_other_session(in_worker=False))
+    # On the event loop, the other session waits for the whole query
+    assert delay > elapsed / 2
+    elapsed, delay = asyncio.run(delays_of_other_session(in_worker=True))
+    assert delay < elapsed / 4
+
+def descendants(component):
+    for child in getattr(component, 'components', []):
+        yield child
+        yield from descendants(child)
+
+def test_add_to_cart_writes_in_database_worker(webapp, monkeypatch):
+    threads = []
+    save = webapp.carts.save
+    monkeypatch.setattr(webapp.carts, 'save', lambda session_id: (
+        threads.append(threading.current_thread().name), save(session_id)))
+    div = jp.Div()
+    webapp.display_pdp(model.catalogue.get('000002'), div)
+    for component in descendants(div):
+        if isinstance(component, jp.Select):
+            component.value = component.components[0].value
+    button = next(component for component in descendants(div)
+                  if isinstance(component, jp.Button))
+
+    asyncio.run(button.run_event_function('click', {'session_id': 'abc'}))
+
+    assert threads and threads[0].startswith('database')
+    assert 'se ha añadido' in next(
+        component.text for component in descendants(div)
+        if 'text-pink-400' in str(component.classes)
+        and isinstance(component, jp.Div))
+    with db.session_scope() as session:
+        assert session.execute(select(model.StoredCart.session_id)).scalars() \
+            .all() == ['abc']
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from sqlalchemy import select
+
+import database as db
+import migrations
+import model
+
+def stored_sessions() -> set[str]:
+    with db.session_scope() as session:
+        return set(session.execute(
+            select(model.StoredCart.session_id)).scalars())
+
+def test_sweep_deletes_stored_carts_of_visitors_who_never_return(shop):
+    migrations.upgrade()
+    carts = model.CartStore(persist=True, ttl=60)
+    long_ago = time.time() - 120
+    with db.session_scope() as session:
+        for session_id, last_access in (('gone', long_ago),
+                                        ('live', long_ago),
+                                        ('recent', time.time())):
+            session.add(model.StoredCart(session_id=session_id, items='[]',
+                                         last_access=last_access))
+    # A visitor still browsing keeps their cart even if it was saved long ago
+    carts._carts['live'] = (model.Cart(), time.time())
+
+    carts.sweep()
+
+    assert stored_sessions() == {'live', 'recent'}
+    assert carts.metrics['swept'] == 1
+
+def test_slow_restore_does_not_hold_up_other_sessions(shop, monkeypatch):
+    migrations.upgrade()
+    carts = model.CartStore(persist=True)
+    other_cart = carts.get('other')
+    restoring = threading.Event()
+    finish_restore = threading.Event()
+    restore = carts._restore
+
+    def slow_restore(session_id: str, now: float):
+        restoring.set()
+        finish_restore.wait(5)
+        return restore(session_id, now)
+
+    monkeypatch.setattr(carts, '_restore', slow_restore)
+    new_visitor = threading.Thread(target=carts.get, args=('new',))
+    new_visitor.start()
+    try:
+        assert restoring.wait(5)
+        start = time.perf_counter()
+        assert carts.get('other') is other_cart
+        assert time.perf_counter()-start < 1
+    finally:
+        finish_restore.set()
+        new_visitor.join()
+    assert carts.metrics['created'] == 2
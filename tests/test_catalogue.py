@@ -0,0 +1,58 @@
+import threading
+
+from sqlalchemy import event
+
+import database as db
+import model
+
+def test_pages_stay_consistent_while_products_are_patched(shop):
+    catalogue = model.Catalogue()
+    catalogue.load()
+    expected = [product.product_id for product in catalogue.page(limit=1000)[0]]
+    products = db.get_table_objects(model.Product)
+    done = threading.Event()
+
+    def patch_products() -> None:
+        while not done.is_set():
+            for product in products:
+                catalogue.patch(product)
+
+    writer = threading.Thread(target=patch_products)
+    writer.start()
+    try:
+        for _ in range(200):
+            seen = []
+            cursor = None
+            while True:
+                page, cursor = catalogue.page(after=cursor, limit=3)
+                seen.extend(product.product_id for product in page)
+                if cursor is None:
+                    break
+            assert seen == expected
+    finally:
+        done.set()
+        writer.join()
+    assert catalogue.version > 1
+
+def test_get_many_reads_missing_products_with_one_query(shop):
+    catalogue = model.Catalogue()
+    catalogue.load()
+    with db.session_scope() as session:
+        for i in range(5):
+            session.add(model.Product(
+                product_id=f'{100+i:06d}', name='Nuevo', price=1.0,
+                category=model.Category.MAKEUP.value, description='.',
+                images='a.jpg', colors='.', sizes='.', available_units=1))
+    statements = []
+    event.listen(db.get_engine(), 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+
+    products = catalogue.get_many(['000001', '000100', '000101', '000102',
+                                   '000103', '000104', '999999'])
+
+    assert sorted(products) == ['000001', '000100', '000101', '000102',
+                                '000103', '000104']
+    assert len(statements) == 1
+    assert catalogue.metrics['misses'] == 6
+    # Found products join the snapshot
+    assert catalogue.get('000104') is products['000104']
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+import database as db
+import migrations
+import model
+
+BUYER_INFO = {
+    'name': 'Compradora',
+    'email': 'compradora@example.com',
+    'phone': '3000000000',
+    'city': 'Barranquilla',
+    'department': 'Atlántico',
+    'address': 'Calle 1',
+    'zipcode': '080001',
+}
+
+STOCK = 5
+CHECKOUTS = 24
+
+@pytest.fixture
+def limited_product(shop):
+    """ID of a product with STOCK available units."""
+    migrations.upgrade()
+    with db.session_scope() as session:
+        product = session.get(model.Product, '000001')
+        product.available_units = STOCK
+    model.catalogue.load()
+    return '000001'
+
+def test_parallel_checkouts_never_oversell(limited_product):
+    with db.session_scope() as session:
+        orders_before = session.execute(
+            select(func.count()).select_from(model.Order)).scalar()
+    carts = []
+    for _ in range(CHECKOUTS):
+        cart = model.Cart()
+        cart.add_item(limited_product, 1, 'Negro', 'M')
+        carts.append(cart)
+    # Every checkout starts at once
+    barrier = threading.Barrier(CHECKOUTS)
+    placed = []
+    rejected = []
+
+    def checkout(cart: model.Cart) -> None:
+        barrier.wait()
+        try:
+            placed.append(cart.place_order(BUYER_INFO))
+        except Exception as e:
+            rejected.append(str(e))
+
+    threads = [threading.Thread(target=checkout, args=(cart,))
+               for cart in carts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(placed) == STOCK
+    assert len(set(placed)) == STOCK
+    assert rejected == ['No hay suficientes unidades disponibles.'] \
+                      * (CHECKOUTS-STOCK)
+    with db.session_scope() as session:
+        assert session.get(model.Product,
+                           limited_product).available_units == 0
+        orders_after = session.execute(
+            select(func.count()).select_from(model.Order)).scalar()
+    assert orders_after - orders_before == STOCK
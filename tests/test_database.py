@@ -0,0 +1,35 @@
+from sqlalchemy import func, select
+
+import database as db
+import migrations
+import model
+
+def stored_sessions() -> list[str]:
+    with db.session_scope() as session:
+        return list(session.execute(
+            select(model.StoredCart.session_id)
+            .order_by(model.StoredCart.session_id)).scalars())
+
+def test_writes_while_streaming_are_kept_after_early_break(shop):
+    migrations.upgrade()
+    for product_id in db.stream_table_objects(
+            model.Product, columns=[model.Product.product_id], batch_size=2):
+        db.add_to_db(model.StoredCart(session_id=product_id[0], items='[]',
+                                      last_access=0))
+        if len(stored_sessions()) == 3:
+            break
+
+    assert stored_sessions() == ['000001', '000002', '000003']
+
+def test_streaming_inside_a_session_scope_leaves_it_usable(shop):
+    migrations.upgrade()
+    with db.session_scope() as session:
+        products = db.stream_table_objects(model.Product, batch_size=3)
+        first = next(products)
+        session.add(model.StoredCart(session_id=first.product_id, items='[]',
+                                     last_access=0))
+        products.close()
+    assert stored_sessions() == [first.product_id]
+    with db.session_scope() as session:
+        assert session.execute(
+            select(func.count()).select_from(model.Product)).scalar() == 10
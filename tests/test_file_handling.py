@@ -0,0 +1,11 @@
+import os
+import stat
+
+import file_handling as file
+
+def test_write_fields_keeps_permissions_of_the_file(shop):
+    os.chmod('perfil.txt', 0o644)
+    file.write_fields('perfil.txt', {'Correo': 'tienda@ejemplo.com'})
+    assert stat.S_IMODE(os.stat('perfil.txt').st_mode) == 0o644
+    assert file.get_content_by_field('perfil.txt', 'Correo') \
+        == 'tienda@ejemplo.com'
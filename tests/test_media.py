@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import shutil
+
+import justpy as jp
+import pytest
+from sqlalchemy import select
+from starlette.applications import Starlette
+
+from conftest import ROOT
+import database as db
+import media
+import migrations
+import model
+
+def send(app, method: str, path: str,
+         headers: dict[str, str] | None = None, chunks=()) -> dict:
+    """Sends a request straight to an ASGI application, with its body in
+    the given chunks, and returns the status, headers and body of its
+    response."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path,
+        'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in (headers or {}).items()],
+        'server': ('testserver', 80), 'client': ('testclient', 50000),
+    }
+    body = list(chunks) or [b'']
+    messages = []
+
+    async def receive() -> dict:
+        chunk = body.pop(0) if body else b''
+        return {'type': 'http.request', 'body': chunk,
+                'more_body': len(body) > 0}
+
+    async def respond(message: dict) -> None:
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, respond))
+    return {
+        'status': messages[0]['status'],
+        'headers': {name.decode(): value.decode()
+                    for name, value in messages[0]['headers']},
+        'body': b''.join(message.get('body', b'')
+                         for message in messages[1:]),
+    }
+
+def get(app, path: str, headers: dict[str, str] | None = None) -> dict:
+    return send(app, 'GET', path, headers)
+
+def media_app() -> Starlette:
+    app = Starlette()
+    media.mount(app)
+    return app
+
+def test_content_named_files_are_cached_for_good(shop):
+    migrations.upgrade()
+    name = media.store(b'contenido de la imagen', 'foto.jpg')
+    app = media_app()
+
+    first = get(app, f'/static/media/{name}')
+    assert first['status'] == 200
+    assert first['body'] == b'contenido de la imagen'
+    assert first['headers']['cache-control'] == media.IMMUTABLE_CACHE_CONTROL
+    # Strong ETag: the name already identifies the content
+    assert first['headers']['etag'] == f'"{name}"'
+
+    repeat = get(app, f'/static/media/{name}',
+                 {'If-None-Match': first['headers']['etag']})
+    assert repeat['status'] == 304
+    assert repeat['body'] == b''
+
+def test_other_files_are_revalidated(shop):
+    (shop / 'media' / 'logo.png').write_bytes(b'logo')
+    app = media_app()
+
+    first = get(app, '/static/media/logo.png')
+    assert first['status'] == 200
+    assert first['headers']['cache-control'] == \
+        media.REVALIDATE_CACHE_CONTROL
+
+    repeat = get(app, '/static/media/logo.png',
+                 {'If-None-Match': first['headers']['etag']})
+    assert repeat['status'] == 304
+
+def test_images_of_deleted_products_are_collected(shop, monkeypatch):
+    migrations.upgrade()
+    for name in ('sm1.jpg', 'km1.jpg', 'logo.png', 'icon_TikTok.png'):
+        shutil.copy(os.path.join(ROOT, 'media', name), shop / 'media')
+    monkeypatch.setattr(media.collector, 'grace_period', 0)
+
+    db.get_from_db(model.Product, '000001').delete_product()
+    media.collector.collect()
+
+    remaining = set(os.listdir(shop / 'media'))
+    assert 'sm1.jpg' not in remaining
+    # Still used by a product, and used by the pages
+    assert {'km1.jpg', 'logo.png', 'icon_TikTok.png'} <= remaining
+
+def test_scans_keep_files_not_named_after_their_content(shop, monkeypatch):
+    migrations.upgrade()
+    (shop / 'media' / 'viejo.jpg').write_bytes(b'imagen de antes')
+    (shop / 'media' / 'logo.png').write_bytes(b'logo')
+    monkeypatch.setattr(media.collector, 'grace_period', 0)
+
+    media.collector.collect()
+
+    assert {'viejo.jpg', 'logo.png'} <= set(os.listdir(shop / 'media'))
+
+def descendants(component):
+    for child in getattr(component, 'components', []):
+        yield child
+        yield from descendants(child)
+
+def media_urls(component) -> set[str]:
+    return {child.src for child in descendants(component)
+            if isinstance(child, jp.Img)
+            and child.src.startswith(f'/static/{media.MEDIA_DIR}/')}
+
+def test_repeat_catalogue_loads_make_no_media_requests(webapp):
+    for name in os.listdir(os.path.join(ROOT, 'media')):
+        if name.lower().endswith(media.IMAGE_EXTENSIONS):
+            shutil.copy(os.path.join(ROOT, 'media', name), media.MEDIA_DIR)
+    media.convert_product_images()
+    media.backfill()
+    # Every tab of the catalogue and the page of every product
+    section_div = jp.Div()
+    webapp.shop_section(section_div)
+    tabs = next(child for child in descendants(section_div)
+                if isinstance(child, model.TabsPills))
+    for tab in tabs.tabs:
+        tabs.set_content_div(tab)
+    urls = media_urls(section_div)
+    for product in db.get_table_objects(model.Product):
+        pdp_div = jp.Div()
+        webapp.display_pdp(product, pdp_div)
+        urls |= media_urls(pdp_div)
+    assert len(urls) > 10
+    app = media_app()
+
+    for url in urls:
+        name = url[len(f'/static/{media.MEDIA_DIR}/'):]
+        assert media._content_name.match(name)
+        response = get(app, url)
+        assert response['status'] == 200
+        # Clients keep the file without asking for it again
+        assert response['headers']['cache-control'] == \
+            media.IMMUTABLE_CACHE_CONTROL
+
+def test_identical_files_are_stored_once_and_counted(shop):
+    migrations.upgrade()
+    name = media.store(b'misma imagen', 'a.jpg')
+    assert media.store(b'misma imagen', 'b.jpg') == name
+    assert [entry for entry in os.listdir(shop / 'media')
+            if entry != 'derived'] == [name]
+    with db.session_scope() as session:
+        assert session.execute(
+            select(media._references.c.refcount)
+            .where(media._references.c.name == name)).scalar() == 2
+
+    # Still used by the other product
+    assert not media.release(name)
+    assert os.path.exists(shop / 'media' / name)
+    assert media.release(name)
+
+def read_image() -> bytes:
+    with open(os.path.join(ROOT, 'media', 'logo.png'), 'rb') as f:
+        return f.read()
+
+async def in_chunks(content: bytes, size: int, sent: list[int]):
+    """Yields content in chunks of the given size, counting those sent."""
+    for start in range(0, len(content), size):
+        sent.append(start)
+        yield content[start:start+size]
+
+def uploads_left() -> list[str]:
+    return os.listdir(media.UPLOAD_DIR)
+
+def test_upload_over_max_bytes_is_rejected_and_removed(shop):
+    sent = []
+    with pytest.raises(Exception, match='tamaño máximo'):
+        asyncio.run(media.receive_upload(
+            in_chunks(read_image(), 100, sent), max_bytes=1000))
+    assert len(sent) == 11
+    assert uploads_left() == []
+
+def test_upload_that_is_not_an_image_is_rejected_from_its_head(shop):
+    sent = []
+    with pytest.raises(Exception, match='no es una imagen'):
+        asyncio.run(media.receive_upload(
+            in_chunks(b'<html>' + b'x'*10000, 6, sent)))
+    # Only the first 12 bytes were read
+    assert len(sent) == 2
+    assert uploads_left() == []
+
+@pytest.fixture
+def upload_app(webapp):
+    app = Starlette()
+    app.add_route(webapp.UPLOAD_PATH, webapp.upload_image, methods=['POST'])
+    return app
+
+@pytest.fixture
+def admin_cookie(webapp) -> dict[str, str]:
+    """Cookie of a session the admin logged in from."""
+    webapp.admin_sessions.add('admin')
+    token = jp.cookie_signer.sign('admin').decode('utf-8')
+    return {'Cookie': f'{jp.SESSION_COOKIE_NAME}={token}'}
+
+def test_upload_needs_an_admin_session(webapp, upload_app):
+    response = send(upload_app, 'POST', webapp.UPLOAD_PATH,
+                    chunks=[read_image()])
+    assert response['status'] == 403
+    assert not os.path.exists(media.UPLOAD_DIR) or uploads_left() == []
+
+def test_upload_declared_too_large_is_refused_unread(webapp, upload_app,
+                                                     admin_cookie):
+    headers = {**admin_cookie,
+               'Content-Length': str(media.MAX_UPLOAD_BYTES+1)}
+    response = send(upload_app, 'POST', webapp.UPLOAD_PATH, headers)
+    assert response['status'] == 413
+
+def test_store_upload_needs_a_received_upload(shop):
+    migrations.upgrade()
+    with pytest.raises(Exception, match='no válida'):
+        media.store_upload('../shop.db')
+    with pytest.raises(Exception, match='ya no está disponible'):
+        media.store_upload('0123456789abcdef0123456789abcdef.png')
+
+def test_uploaded_image_is_linked_to_new_product(webapp, upload_app,
+                                                 admin_cookie):
+    content = read_image()
+    response = send(upload_app, 'POST', webapp.UPLOAD_PATH, admin_cookie,
+                    [content[:1000], content[1000:]])
+    assert response['status'] == 200
+    name = json.loads(response['body'])['name']
+    assert name == media.content_name(content, 'logo.png')
+
+    product = model.Product(name='Nuevo', price=1.0,
+                            category=model.Category.MAKEUP.value,
+                            description='.', colors='.', sizes='.',
+                            available_units=1)
+    product.add_product([name])
+
+    assert db.get_from_db(model.Product, product.product_id).images == name
+    assert uploads_left() == []
+    with open(os.path.join(media.MEDIA_DIR, name), 'rb') as f:
+        assert f.read() == content
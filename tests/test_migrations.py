@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+
+import database as db
+import migrations
+import model
+
+def query_plan(statement) -> str:
+    """Returns the details of every step of the plan SQLite chooses for a
+    statement."""
+    sql = str(statement.compile(dialect=sqlite.dialect(),
+                                compile_kwargs={'literal_binds': True}))
+    with db.get_engine().connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')
+        return ' | '.join(row[-1] for row in rows)
+
+HOT_QUERIES = {
+    # Items of an order, as display_order reads them
+    'ix_orderitems_order_id':
+        select(model.OrderItem)
+        .where(model.OrderItem.order_id == '000001'),
+    # Items of a product
+    'ix_orderitems_product_id':
+        select(model.OrderItem)
+        .where(model.OrderItem.product_id == '000001'),
+    # Available products of a category, as the catalogue lists them
+    'ix_products_category_available_units':
+        select(model.Product)
+        .where(model.Product.category == model.Category.SKIRTS.value,
+               model.Product.available_units > 0),
+    # Orders with a status, as the admin's orders tab filters them
+    'ix_orders_status_date':
+        select(model.Order)
+        .where(model.Order.status == model.OrderStatus.PENDING.value)
+        .order_by(model.Order.date),
+}
+
+@pytest.mark.parametrize('index', HOT_QUERIES)
+def test_hot_queries_use_indexes(shop, index):
+    assert index not in query_plan(HOT_QUERIES[index])
+    migrations.upgrade()
+    assert f'USING INDEX {index}' in query_plan(HOT_QUERIES[index])
+
+def test_upgrade_is_recorded_and_can_run_again(shop):
+    latest = migrations.MIGRATIONS[-1][0]
+    assert migrations.upgrade() == latest
+    assert migrations.current_version() == latest
+    assert migrations.upgrade() == latest
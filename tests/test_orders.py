@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import select
+
+import database as db
+import model
+
+PENDING = model.OrderStatus.PENDING
+APPROVED = model.OrderStatus.APPROVED
+DELIVERED = model.OrderStatus.DELIVERED
+
+@pytest.fixture
+def orders(shop):
+    """IDs of three pending orders, of two items each, created on
+    different dates, besides the order already in the shop."""
+    dates = {'100001': '2023-01-10', '100002': '2023-02-10',
+             '100003': '2023-03-10'}
+    with db.session_scope() as session:
+        session.execute(model.Order.__table__.insert(), [
+            {'order_id': order_id, 'total': 1.0, 'date': date,
+             'status': PENDING.value}
+            for order_id, date in dates.items()
+        ])
+        session.execute(model.OrderItem.__table__.insert(), [
+            {'order_id': order_id, 'product_id': product_id, 'quantity': 1,
+             'color': '.', 'size': '.'}
+            for order_id in dates for product_id in ('000002', '000003')
+        ])
+    return ['100001', '100002', '100003']
+
+def statuses() -> dict[str, str]:
+    with db.session_scope() as session:
+        return dict(session.execute(
+            select(model.Order.order_id, model.Order.status)).all())
+
+def orders_with_items() -> set[str]:
+    with db.session_scope() as session:
+        return set(session.execute(
+            select(model.OrderItem.order_id)).scalars())
+
+def test_update_statuses_of_listed_orders(orders):
+    updated = model.Order.update_statuses(APPROVED,
+                                          order_ids=['100001', '100003'])
+
+    assert sorted(updated) == ['100001', '100003']
+    assert statuses() == {'000002': PENDING.value,
+                          '100001': APPROVED.value,
+                          '100002': PENDING.value,
+                          '100003': APPROVED.value}
+
+def test_update_statuses_of_filtered_orders(orders):
+    updated = model.Order.update_statuses(APPROVED, status=PENDING.value,
+                                          date_from='2023-02-01')
+
+    assert sorted(updated) == ['100002', '100003']
+    assert statuses()['100001'] == PENDING.value
+
+def test_delivered_orders_are_deleted_with_their_items(orders):
+    updated = model.Order.update_statuses(DELIVERED,
+                                          order_ids=['100001', '100002'])
+
+    assert sorted(updated) == ['100001', '100002']
+    assert set(statuses()) == {'000002', '100003'}
+    assert orders_with_items() == {'000002', '100003'}
+
+def test_update_statuses_needs_orders_or_filters(orders):
+    with pytest.raises(Exception):
+        model.Order.update_statuses(DELIVERED)
+    assert set(statuses()) == {'000002', *orders}
+    assert orders_with_items() == {'000002', *orders}